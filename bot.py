@@ -1,41 +1,99 @@
 import streamlit as st
-import telebot
-from telebot import types
-import whisper
-from groq import Groq
-import os, json, threading, pytz, torch, time, re
+import asyncio
+import groq
+from groq import AsyncGroq
+import os, io, json, threading, pytz, time, re, sqlite3, hashlib
+import numpy as np
+from session_store import SessionStore
+from tg_download import FileTooLarge, check_size, download as fetch_file
+from tracing import Tracer
+from whisper_engine import (SAMPLE_RATE, OPUS_BITRATE, EngineStats, create_pool, decode_audio, encode_opus,
+                            split_on_silence, transcribe_piece, worker_info)
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from deep_translator import GoogleTranslator
+from lazy_import import lazy, mark, report as cold_start_report
+from aiogram import Bot, Dispatcher, types, F
+from aiogram.filters import Command
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import GetUpdates
+from aiogram.types import BufferedInputFile, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+
+# Tarjimon (requests, bs4) birinchi tarjimada yuklanadi; torch va whisper faqat Whisper ishchi jarayonlarida
+deep_translator = lazy("deep_translator")
+mark("skript_importlari")
 
 # --- 0. ADMIN VA BAZA SOZLAMALARI ---
 ADMIN_ID = 1416457518 # Sizning Telegram ID
-USERS_FILE = "bot_users_list.txt"
+USERS_FILE = "bot_users_list.txt" # Eski format, faqat bir martalik ko'chirish uchun
+USERS_DB = "bot_users.db"
 uz_tz = pytz.timezone('Asia/Tashkent')
 
 def get_uz_time():
     """O'zbekiston vaqtini qaytaradi"""
     return datetime.now(uz_tz).strftime('%H:%M:%S')
 
-def log_user_and_get_count(m):
+class UserStore:
+    """Foydalanuvchilar bazasi: SQLite fayl + xotiradagi indeks (uid -> tartib raqami)"""
+
+    LINE_RE = re.compile(r"(\d+)\. ID: (\d+) \| Ism: (.*?) \| User: (.*?) \| Sana: (.*)")
+
+    def __init__(self, path, legacy_file=None):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS users (seq INTEGER PRIMARY KEY, uid INTEGER UNIQUE, name TEXT, username TEXT, joined TEXT)")
+        if legacy_file and os.path.exists(legacy_file) and not self.db.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            self._import_legacy(legacy_file)
+        self.index = dict(self.db.execute("SELECT uid, seq FROM users"))
+
+    def _import_legacy(self, path):
+        """Eski bot_users_list.txt faylini bir marta bazaga ko'chirish (tartib raqamlari saqlanadi)"""
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [(i + 1, int(m.group(2)), m.group(3), m.group(4), m.group(5))
+                    for i, m in enumerate(self.LINE_RE.match(line.strip()) for line in f) if m]
+        self.db.executemany("INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+    def add(self, uid, name, username):
+        """(tartib raqami, yangi foydalanuvchimi) qaytaradi"""
+        with self.lock:
+            seq = self.index.get(uid)
+            if seq: return seq, False
+            seq = self.db.execute("INSERT INTO users (uid, name, username, joined) VALUES (?, ?, ?, ?)",
+                                  (uid, name, username, get_uz_time())).lastrowid
+            self.db.commit()
+            self.index[uid] = seq
+            return seq, True
+
+    def __len__(self):
+        return len(self.index)
+
+    def pages(self, size=500):
+        """Ro'yxatni sahifalab o'qiydi (butun bazani xotiraga yuklamasdan)"""
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute("SELECT seq, uid, name, username, joined FROM users WHERE seq > ? ORDER BY seq LIMIT ?", (last, size)).fetchall()
+            if not rows: return
+            yield [f"{seq}. ID: {uid} | Ism: {name} | User: {username} | Sana: {joined}\n" for seq, uid, name, username, joined in rows]
+            last = rows[-1][0]
+
+@st.cache_resource
+def get_user_store():
+    return UserStore(USERS_DB, legacy_file=USERS_FILE)
+
+user_store = get_user_store()
+
+async def log_user_and_get_count(m):
     """Foydalanuvchini ro'yxatga oladi va uning tartib raqamini qaytaradi"""
     uid = m.from_user.id
     first_name = m.from_user.first_name
     username = f"@{m.from_user.username}" if m.from_user.username else "yo'q"
     
-    user_list = []
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, "r", encoding="utf-8") as f:
-            user_list = f.readlines()
-            
-    # UID bazada bormi tekshirish
-    exists = any(str(uid) in line for line in user_list)
-    
-    if not exists:
-        count = len(user_list) + 1
-        user_row = f"{count}. ID: {uid} | Ism: {first_name} | User: {username} | Sana: {get_uz_time()}\n"
-        with open(USERS_FILE, "a", encoding="utf-8") as f:
-            f.write(user_row)
-        
+    count, is_new = await asyncio.to_thread(user_store.add, uid, first_name, username)
+    if is_new:
         # Adminga xabar
         report = (
             f"🆕 *YANGI FOYDALANUVCHI! (№{count})*\n\n"
@@ -43,19 +101,11 @@ def log_user_and_get_count(m):
             f"🆔 ID: `{uid}`\n"
             f"⏰ Vaqt: {get_uz_time()}"
         )
-        try: bot.send_message(ADMIN_ID, report, parse_mode="Markdown")
+        try: await bot.send_message(ADMIN_ID, report, parse_mode="Markdown")
         except: pass
-        return count
-    else:
-        # Agar mavjud bo'lsa, tartib raqamini aniqlash
-        for i, line in enumerate(user_list):
-            if str(uid) in line:
-                return i + 1
-    return len(user_list)
+    return count
 
 # --- 1. GLOBAL KONFIGURATSIYA ---
-processing_lock = threading.Lock()
-waiting_users = 0
 WEB_APP_URL = "https://script1232.streamlit.app" 
 
 try:
@@ -65,41 +115,659 @@ except:
     st.error("❌ Secrets-da kerakli kalitlar topilmadi!")
     st.stop()
 
-client_groq = Groq(api_key=GROQ_API_KEY)
+# Har bir rejim uchun bir vaqtda ishlaydigan vazifalar soni
+GROQ_WORKERS = int(st.secrets.get("GROQ_WORKERS", 6))
+LOCAL_WORKERS = int(st.secrets.get("LOCAL_WORKERS", 1))
+RACE_WORKERS = int(st.secrets.get("RACE_WORKERS", 4))
+# Lokal Whisper jarayonlari soni (har biri o'z modelini saqlaydi) va Groq'ga bir vaqtda yuboriladigan bo'laklar soni
+LOCAL_PROCS = int(st.secrets.get("LOCAL_PROCS", max(1, min(4, (os.cpu_count() or 2) // 2))))
+GROQ_CHUNK_WORKERS = int(st.secrets.get("GROQ_CHUNK_WORKERS", 4))
+# Lokal Whisper dvigateli: model o'lchami, oldindan yuklanadigan modellar, int8 kvantlash, jarayon boshiga torch oqimlari
+WHISPER_MODEL = st.secrets.get("WHISPER_MODEL", "base")
+WHISPER_PRELOAD = [m.strip() for m in str(st.secrets.get("WHISPER_PRELOAD", WHISPER_MODEL)).split(",") if m.strip()]
+WHISPER_INT8 = str(st.secrets.get("WHISPER_INT8", "false")).lower() in ("1", "true", "yes")
+TORCH_THREADS = int(st.secrets.get("TORCH_THREADS", 1))
+GROQ_MODEL = "whisper-large-v3-turbo"
+# Groq chidamliligi: qayta urinishlar, circuit breaker (ketma-ket xatolar chegarasi va dam olish vaqti), lokal zaxira
+GROQ_RETRIES = int(st.secrets.get("GROQ_RETRIES", 3))
+GROQ_BREAKER_FAILURES = int(st.secrets.get("GROQ_BREAKER_FAILURES", 5))
+GROQ_BREAKER_COOLDOWN = int(st.secrets.get("GROQ_BREAKER_COOLDOWN", 60))
+GROQ_FALLBACK = str(st.secrets.get("GROQ_FALLBACK", "true")).lower() in ("1", "true", "yes")
+# Race rejimi: Groq shu vaqt ichida javob bermasa lokal Whisper ham ishga tushadi; faqat qisqa kliplar uchun
+RACE_HEDGE_DELAY = float(st.secrets.get("RACE_HEDGE_DELAY", 2.5))
+RACE_MAX_SEC = int(st.secrets.get("RACE_MAX_SEC", 90))
+# Tarjima: bitta so'rovdagi belgilar chegarasi (Google 5000 gacha qabul qiladi) va parallel so'rovlar soni
+TRANSLATE_BATCH_CHARS = 4500
+TRANSLATE_WORKERS = int(st.secrets.get("TRANSLATE_WORKERS", 4))
+TRANSLATION_DB = "translations.db"
+TRANSLATION_CACHE_SIZE = 50000
+# Tayyor transkriptlar keshi (papka va maksimal hajm)
+TRANSCRIPT_CACHE_DIR = "transcript_cache"
+TRANSCRIPT_CACHE_MB = int(st.secrets.get("TRANSCRIPT_CACHE_MB", 200))
+# Telegram chegaralari: bot bo'yicha soniyasiga so'rovlar (Telegram ~30 gacha ruxsat beradi),
+# bitta chatdagi progress tahrirlari orasidagi eng kam vaqt va 429 dan keyin qayta urinishlar soni
+TG_RATE = float(st.secrets.get("TG_RATE", 25))
+PROGRESS_EDIT_SEC = float(st.secrets.get("PROGRESS_EDIT_SEC", 3))
+TG_RETRIES = int(st.secrets.get("TG_RETRIES", 3))
+# Foydalanuvchi sessiyalari: baza, amal qilish muddati va xotirada saqlanadigan sessiyalar soni
+SESSION_DB = "bot_sessions.db"
+SESSION_TTL_HOURS = float(st.secrets.get("SESSION_TTL_HOURS", 24))
+SESSION_MAX_LIVE = int(st.secrets.get("SESSION_MAX_LIVE", 1000))
+# Bosqichlar kechikishini kuzatish (o'chirilsa deyarli xarajatsiz)
+TRACING = str(st.secrets.get("TRACING", "true")).lower() in ("1", "true", "yes")
+# Audio fayl hajmi chegarasi (Bot API 20 MB dan kattasini bermaydi); shundan kichigi xotirada yuklanadi, kattasi diskka
+MAX_AUDIO_MB = int(st.secrets.get("MAX_AUDIO_MB", 20))
+DOWNLOAD_SPOOL_MB = 8
+
+# Qayta urinishlarni SDK emas, pastdagi GroqBackend boshqaradi
+client_groq = AsyncGroq(api_key=GROQ_API_KEY, max_retries=0)
+
+@st.cache_resource
+def get_tracer():
+    return Tracer(TRACING)
+
+tracer = get_tracer()
+
+# --- 1.1 NAVBAT (SCHEDULER) ---
+class JobScheduler:
+    """Rejimlar bo'yicha alohida ishchi hovuzlari va foydalanuvchilar orasida adolatli navbat.
+    Ishchilar bot tsiklidagi korutinalar; lock faqat Streamlit oqimidan statistika o'qish uchun"""
+
+    def __init__(self, limits):
+        self.lock = threading.Lock()
+        # mode -> {uid: deque([job, ...])}; uid tartibi navbatning aylanma (round-robin) tartibi
+        self.queues = {mode: OrderedDict() for mode in limits}
+        self.running = {mode: 0 for mode in limits}
+        self.limits = dict(limits)
+        self.wakeup = {}
+
+    def start(self):
+        """Ishchilarni bot tsiklida ishga tushiradi"""
+        for mode, n in self.limits.items():
+            self.wakeup[mode] = asyncio.Event()
+            for _ in range(n):
+                asyncio.create_task(self._worker(mode))
+
+    def _ahead(self, mode, uid, k):
+        """uid ning k-vazifasidan oldin navbatda turgan vazifalar soni"""
+        ahead, before = 0, True
+        for other, jobs in self.queues[mode].items():
+            if other == uid:
+                before = False
+                ahead += k - 1
+            else:
+                ahead += min(len(jobs), k if before else k - 1)
+        return ahead
+
+    def position(self, mode, uid):
+        """uid hozir yangi vazifa qo'shsa, undan oldin nechta vazifa turishini qaytaradi"""
+        with self.lock:
+            return self._ahead(mode, uid, len(self.queues[mode].get(uid, ())) + 1)
+
+    def submit(self, mode, uid, job):
+        """job - argumentsiz korutina funksiyasi"""
+        with self.lock:
+            self.queues[mode].setdefault(uid, deque()).append((job, time.perf_counter()))
+        self.wakeup[mode].set()
+
+    def stats(self):
+        with self.lock:
+            return {mode: {"navbatda": sum(len(j) for j in q.values()), "ishlamoqda": self.running[mode], "limit": self.limits[mode]}
+                    for mode, q in self.queues.items()}
+
+    async def _worker(self, mode):
+        q = self.queues[mode]
+        while True:
+            while not q:
+                self.wakeup[mode].clear()
+                await self.wakeup[mode].wait()
+            with self.lock:
+                uid, jobs = next(iter(q.items()))
+                job, queued = jobs.popleft()
+                if jobs: q.move_to_end(uid)
+                else: del q[uid]
+                self.running[mode] += 1
+            tracer.record(f"navbat:{mode}", time.perf_counter() - queued)
+            try:
+                with tracer.stage(f"vazifa:{mode}"): await job()
+            except Exception as e: print(f"Job Error: {e}")
+            finally:
+                with self.lock: self.running[mode] -= 1
+
+@st.cache_resource
+def get_scheduler():
+    return JobScheduler({"groq": GROQ_WORKERS, "local": LOCAL_WORKERS, "race": RACE_WORKERS})
+
+scheduler = get_scheduler()
+
+# --- 1.2 TARJIMA (PAKETLAR + KESH) ---
+class TranslationCache:
+    """(matn, til) juftligi bo'yicha diskda (SQLite) saqlanadigan LRU kesh"""
+
+    def __init__(self, path, max_items):
+        self.lock = threading.Lock()
+        self.max_items = max_items
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS tr (lang TEXT, src TEXT, dst TEXT, used REAL, PRIMARY KEY (lang, src))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS tr_used ON tr (used)")
+        self.db.commit()
+
+    def get_many(self, texts, lang):
+        found = {}
+        with self.lock:
+            for t in set(texts):
+                row = self.db.execute("SELECT dst FROM tr WHERE lang=? AND src=?", (lang, t)).fetchone()
+                if row: found[t] = row[0]
+            if found:
+                now = time.time()
+                self.db.executemany("UPDATE tr SET used=? WHERE lang=? AND src=?", [(now, lang, t) for t in found])
+                self.db.commit()
+        return found
+
+    def put_many(self, pairs, lang):
+        with self.lock:
+            now = time.time()
+            self.db.executemany("INSERT OR REPLACE INTO tr VALUES (?, ?, ?, ?)", [(lang, src, dst, now) for src, dst in pairs.items()])
+            extra = self.db.execute("SELECT COUNT(*) FROM tr").fetchone()[0] - self.max_items
+            if extra > 0:
+                # Eng uzoq ishlatilmagan tarjimalarni o'chirish
+                self.db.execute("DELETE FROM tr WHERE rowid IN (SELECT rowid FROM tr ORDER BY used LIMIT ?)", (extra,))
+            self.db.commit()
+
+@st.cache_resource
+def get_translator():
+    tracer.pool("tarjima", TRANSLATE_WORKERS)
+    return TranslationCache(TRANSLATION_DB, TRANSLATION_CACHE_SIZE), ThreadPoolExecutor(max_workers=TRANSLATE_WORKERS)
+
+def translate_texts(texts, lang_code):
+    """Matnlarni tartibini saqlagan holda tarjima qiladi: kesh, paketlash va parallel so'rovlar"""
+    cache, executor = get_translator()
+    done = cache.get_many(texts, lang_code)
+    missing = list(dict.fromkeys(t for t in texts if t and t not in done))
+
+    # Matnlarni belgilar chegarasidan oshmaydigan paketlarga yig'ish
+    batches, cur, size = [], [], 0
+    for t in missing:
+        if cur and size + len(t) + 1 > TRANSLATE_BATCH_CHARS:
+            batches.append(cur); cur, size = [], 0
+        cur.append(t); size += len(t) + 1
+    if cur: batches.append(cur)
+
+    def run(batch):
+        tr = deep_translator.GoogleTranslator(source='auto', target=lang_code)
+        out = (tr.translate("\n".join(t.replace("\n", " ") for t in batch)) or "").split("\n")
+        if len(out) != len(batch):
+            # Qatorlar mosligi buzilsa, har bir matnni alohida tarjima qilamiz
+            out = [tr.translate(t) or t for t in batch]
+        return dict(zip(batch, (o.strip() for o in out)))
+
+    if batches:
+        new = {}
+        for fut in [tracer.track("tarjima", executor.submit(run, b)) for b in batches]: new.update(fut.result())
+        cache.put_many(new, lang_code)
+        done.update(new)
+    return [done.get(t, t) for t in texts]
+
+# --- 1.3 TRANSKRIPT KESHI ---
+class TranscriptCache:
+    """Transkriptlarni (fayl kaliti, dvigatel) bo'yicha diskda saqlaydi, hajm oshsa eng eskilarini o'chiradi"""
+
+    def __init__(self, folder, max_bytes):
+        self.folder, self.max_bytes = folder, max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.total = sum(e.stat().st_size for e in os.scandir(folder) if e.is_file())
+
+    def _path(self, key, engine):
+        return os.path.join(self.folder, f"{engine}_{key}.json")
+
+    def get(self, key, engine):
+        path = self._path(key, engine)
+        try:
+            with open(path, "r", encoding="utf-8") as f: segments = json.load(f)
+            os.utime(path)  # LRU uchun oxirgi foydalanish vaqtini yangilash
+            return segments
+        except (OSError, ValueError):
+            return None
+
+    def put(self, keys, engine, segments):
+        data = json.dumps(segments, ensure_ascii=False).encode("utf-8")
+        with self.lock:
+            for key in keys:
+                path = self._path(key, engine)
+                old = os.path.getsize(path) if os.path.exists(path) else 0
+                with open(path + ".tmp", "wb") as f: f.write(data)
+                os.replace(path + ".tmp", path)
+                self.total += len(data) - old
+            if self.total > self.max_bytes:
+                files = sorted((e for e in os.scandir(self.folder) if e.is_file()), key=lambda e: e.stat().st_mtime)
+                for e in files:
+                    if self.total <= self.max_bytes: break
+                    size = e.stat().st_size
+                    try: os.remove(e.path)
+                    except OSError: continue
+                    self.total -= size
+
+@st.cache_resource
+def get_transcript_cache():
+    return TranscriptCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MB * 1024 * 1024)
+
+transcript_cache = get_transcript_cache()
+
+@st.cache_resource
+def get_engine_stats():
+    return EngineStats()
+
+engine_stats = get_engine_stats()
+
+@st.cache_resource
+def load_local_pool():
+    # Standart 'base' modeli aniqlik va tezlik balansi uchun tanlangan; har bir jarayon o'z modellarini saqlaydi
+    tracer.pool("whisper", LOCAL_PROCS)
+    pool = create_pool(LOCAL_PROCS, [WHISPER_MODEL] + [m for m in WHISPER_PRELOAD if m != WHISPER_MODEL],
+                       quantize=WHISPER_INT8, threads=TORCH_THREADS)
+    # Ishchilarni darhol ishga tushirish: modellar birinchi foydalanuvchidan oldin yuklanib, qizdirib olinadi
+    def on_ready(f):
+        if not f.exception(): engine_stats.set_warmup(f.result())
+    pool.submit(worker_info).add_done_callback(on_ready)
+    return pool
+
+load_local_pool()
+
+@st.cache_resource
+def get_groq_limiter():
+    # Groq'ga bir vaqtda ketayotgan bo'lak so'rovlari chegarasi (barcha vazifalar uchun umumiy)
+    return asyncio.Semaphore(GROQ_CHUNK_WORKERS)
+
+# --- 1.4 BO'LAKLAB TRANSKRIPSIYA ---
+# Bitta bo'lakning eng katta uzunligi (soniya). Groq bo'laklari yuklash hajmi chegarasidan ham oshmasligi kerak
+LOCAL_CHUNK_SEC = 60
+GROQ_MAX_UPLOAD_MB = 25
+GROQ_CHUNK_SEC = min(120, int(GROQ_MAX_UPLOAD_MB * 1024 * 1024 * 0.9 / (int(OPUS_BITRATE[:-1]) * 1000 / 8)))
+STREAM_FLUSH_CHARS = 3000 # Chatga qismlab yuborish chegarasi
+
+class GroqUnavailable(Exception):
+    pass
+
+class GroqBackend:
+    """Groq so'rovlari uchun o'ram: 429/5xx/tarmoq xatolarida eksponensial kutib qayta urinish,
+    ketma-ket xatolar ko'payganda circuit breaker orqali trafikni vaqtincha to'xtatish va holat statistikasi"""
+
+    RETRYABLE = (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError)
+
+    def __init__(self, client, retries, fail_threshold, cooldown):
+        self.client, self.retries = client, retries
+        self.fail_threshold, self.cooldown = fail_threshold, cooldown
+        self.lock = threading.Lock()
+        self.failures = 0        # ketma-ket xatolar
+        self.opened_at = None    # breaker ochilgan vaqt (None - yopiq)
+        self.probing = False     # yarim ochiq holatda bitta sinov so'rovi ketmoqda
+        self.counts = {"ok": 0, "fail": 0, "retry": 0, "rejected": 0, "fallback": 0, "bad_request": 0}
+
+    def state(self):
+        if self.opened_at is None: return "closed"
+        return "half-open" if time.time() - self.opened_at >= self.cooldown else "open"
+
+    def _allow(self):
+        with self.lock:
+            state = self.state()
+            if state == "closed": return True
+            if state == "half-open" and not self.probing:
+                self.probing = True
+                return True
+            self.counts["rejected"] += 1
+            return False
+
+    def _done(self, ok):
+        """ok=None - hukm yo'q (so'rov bekor qilindi yoki faylning o'zi yaroqsiz): faqat sinov so'rovi bo'shatiladi"""
+        with self.lock:
+            self.probing = False
+            if ok is None: return
+            if ok:
+                self.counts["ok"] += 1
+                self.failures, self.opened_at = 0, None
+            else:
+                self.counts["fail"] += 1
+                self.failures += 1
+                if self.failures >= self.fail_threshold or self.opened_at is not None:
+                    self.opened_at = time.time()
+
+    @staticmethod
+    def _retry_after(e, attempt):
+        """Server ko'rsatgan retry-after, bo'lmasa 1, 2, 4... soniya (+ tasodifiy siljish)"""
+        try:
+            return min(30.0, float(e.response.headers["retry-after"]))
+        except Exception:
+            return min(30.0, 2 ** attempt) + np.random.uniform(0, 0.5)
+
+    async def transcribe(self, audio_file):
+        if not self._allow():
+            raise GroqUnavailable("circuit breaker ochiq")
+        # Breakerga faqat 429/5xx/tarmoq xatolari ta'sir qiladi; bekor qilish (race, stream yopilishi) hukm emas.
+        # finally: yarim ochiq holatdagi sinov har qanday chiqishda bo'shatiladi
+        verdict = None
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    res = await self.client.audio.transcriptions.create(file=audio_file, model=GROQ_MODEL, response_format="verbose_json")
+                except self.RETRYABLE as e:
+                    if attempt < self.retries:
+                        with self.lock: self.counts["retry"] += 1
+                        await asyncio.sleep(self._retry_after(e, attempt))
+                        continue
+                    verdict = False
+                    raise GroqUnavailable(e)
+                except Exception as e:
+                    # 400/413 kabi so'rovning o'ziga bog'liq xatolar: qayta urinish foydasiz, servis esa ishlayapti
+                    with self.lock: self.counts["bad_request"] += 1
+                    raise GroqUnavailable(e)
+                verdict = True
+                return res
+        finally:
+            self._done(verdict)
+
+    def note_fallback(self):
+        with self.lock: self.counts["fallback"] += 1
+
+    def health(self):
+        with self.lock:
+            total = self.counts["ok"] + self.counts["fail"]
+            return dict(self.counts, state=self.state(), consecutive_failures=self.failures,
+                        failure_rate=round(self.counts["fail"] / total, 3) if total else 0.0)
+
+@st.cache_resource
+def get_groq_backend():
+    return GroqBackend(client_groq, GROQ_RETRIES, GROQ_BREAKER_FAILURES, GROQ_BREAKER_COOLDOWN)
+
+groq_backend = get_groq_backend()
+
+def local_transcribe(samples, offset, language=None):
+    """Bo'lakni lokal Whisper jarayonlar hovuziga beradi (CPU ishi bot tsiklini band qilmaydi).
+    Ishchi jarayon o'lsa (masalan, katta model yuklanayotganda xotira yetmay), hovuz butunlay buziladi:
+    keshdagi hovuz tashlanib, vazifa yangi hovuzga beriladi"""
+    pool = load_local_pool()
+    try: fut = pool.submit(transcribe_piece, samples, offset, language, WHISPER_MODEL)
+    except BrokenProcessPool:
+        load_local_pool.clear(); pool.shutdown(wait=False)
+        fut = load_local_pool().submit(transcribe_piece, samples, offset, language, WHISPER_MODEL)
+    return asyncio.wrap_future(tracer.track("whisper", fut))
+
+async def groq_transcribe(samples, offset, fallback=GROQ_FALLBACK):
+    """Bitta bo'lakni Groq orqali tahlil qiladi; Groq ishlamasa, shu bo'lak lokal Whisper'ga beriladi.
+    (segmentlar, til, sarflangan soniyalar, model) qaytaradi, vaqtlar butun audio boshiga nisbatan"""
+    async with get_groq_limiter():
+        t = time.perf_counter()
+        try:
+            with tracer.stage("opus_kodlash"): opus = await asyncio.to_thread(encode_opus, samples)
+            with tracer.stage("groq"): res = await groq_backend.transcribe(("chunk.ogg", opus))
+        except GroqUnavailable:
+            if not fallback: raise
+            groq_backend.note_fallback()
+            res = None
+    if res is None:
+        return await local_transcribe(samples, offset) + (WHISPER_MODEL,)
+    segs = [{'start': offset + float(s['start']), 'end': offset + float(s['end']), 'text': s['text']} for s in res.segments]
+    return segs, None, time.perf_counter() - t, f"groq:{GROQ_MODEL}"
+
+class RaceStats:
+    """Race rejimi ko'rsatkichlari: qaysi dvigatel qancha yutgani va Groq javob vaqtlari (kechikishni sozlash uchun)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"races": 0, "hedged": 0, "groq": 0, "local": 0}
+        self.groq_latency = deque(maxlen=500)
+
+    def record(self, winner, hedged, groq_sec=None):
+        with self.lock:
+            self.counts["races"] += 1
+            self.counts["hedged"] += hedged
+            self.counts[winner] += 1
+            if groq_sec is not None: self.groq_latency.append(groq_sec)
+
+    def report(self):
+        with self.lock:
+            lat = sorted(self.groq_latency)
+            pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 2) if lat else None
+            return dict(self.counts, groq_p50=pct(0.5), groq_p90=pct(0.9), groq_p99=pct(0.99), hedge_delay=RACE_HEDGE_DELAY)
+
+@st.cache_resource
+def get_race_stats():
+    return RaceStats()
+
+race_stats = get_race_stats()
+
+async def race_transcribe(audio):
+    """Qisqa klipni avval Groq'ga yuboradi; RACE_HEDGE_DELAY ichida javob bo'lmasa (yoki Groq xato bersa)
+    lokal Whisper ham ishga tushadi. Birinchi kelgan natija olinadi, ikkinchisi bekor qilinadi"""
+    t = time.perf_counter()
+    groq_task = asyncio.ensure_future(groq_transcribe(audio, 0.0, False))
+    await asyncio.wait([groq_task], timeout=RACE_HEDGE_DELAY)
+    if groq_task.done() and groq_task.exception() is None:
+        race_stats.record("groq", False, time.perf_counter() - t)
+        return groq_task.result()
+
+    local_task = local_transcribe(audio, 0.0)
+    pending, error = {groq_task, local_task}, None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is not None:
+                error = fut.exception()
+                continue
+            # Yutqazgan tomon bekor qilinadi: Groq so'rovi uziladi, lokal bo'lak boshlanmagan bo'lsa navbatdan olinadi
+            for other in pending: other.cancel()
+            if fut is groq_task:
+                race_stats.record("groq", True, time.perf_counter() - t)
+                return fut.result()
+            race_stats.record("local", True)
+            return fut.result() + (WHISPER_MODEL,)
+    raise error
+
+async def transcribe_stream(audio, mode):
+    """Audioni jimlik joylaridan bo'laklarga bo'lib parallel tahlil qiladi va bo'laklar tartibida
+    (segmentlar, tahlil qilingan soniyalar, ishlagan model) qaytaradi"""
+    if mode == "race":
+        if len(audio) <= RACE_MAX_SEC * SAMPLE_RATE:
+            segs, _, elapsed, model = await race_transcribe(audio)
+            engine_stats.record(model, len(audio) / SAMPLE_RATE, elapsed)
+            yield segs, len(audio) / SAMPLE_RATE, model
+            return
+        mode = "groq" # Uzun audio uchun poyga foydasiz: oddiy Groq (lokal zaxira bilan)
+    if mode == "groq":
+        spans = split_on_silence(audio, GROQ_CHUNK_SEC)
+        submit = lambda a, b, lang: asyncio.ensure_future(groq_transcribe(audio[a:b], a / SAMPLE_RATE))
+    else:
+        spans = split_on_silence(audio, LOCAL_CHUNK_SEC)
+        submit = lambda a, b, lang: local_transcribe(audio[a:b], a / SAMPLE_RATE, lang)
+    if not spans: return
+
+    async def result(a, b, fut):
+        res = await fut
+        segs, lang, elapsed = res[:3]
+        model = res[3] if len(res) > 3 else WHISPER_MODEL # Groq bo'laklari qaysi dvigatelda ishlanganini ham qaytaradi
+        engine_stats.record(model, (b - a) / SAMPLE_RATE, elapsed)
+        return segs, lang, model
+
+    # Birinchi bo'lak alohida: undan aniqlangan til qolgan bo'laklarga beriladi
+    a, b = spans[0]
+    segs, language, model = await result(a, b, submit(a, b, None))
+    yield segs, b / SAMPLE_RATE, model
+
+    futures = [(a, b, submit(a, b, language)) for a, b in spans[1:]]
+    try:
+        for a, b, fut in futures:
+            segs, _, model = await result(a, b, fut)
+            yield segs, b / SAMPLE_RATE, model
+    finally:
+        # Vazifa to'xtatilsa, hali tugamagan bo'laklarni bekor qilish
+        for _, _, fut in futures: fut.cancel()
+
+# --- 1.5 TELEGRAM CHIQISH QATLAMI ---
+class TelegramLimiter(BaseRequestMiddleware):
+    """Bot bo'yicha umumiy token bucket: har bir API so'rovi bitta token oladi.
+    429 (retry_after) kelsa, butun bot shu vaqtga to'xtaydi va so'rov qayta yuboriladi"""
+
+    def __init__(self, rate, retries):
+        self.rate, self.capacity, self.retries = rate, max(1.0, rate), retries
+        self.tokens, self.stamp, self.paused_until = self.capacity, time.monotonic(), 0.0
+        self.lock = None
+        self.counts = {"calls": 0, "throttled": 0, "retry_after": 0}
+
+    async def _take(self):
+        if self.lock is None: self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                self.counts["throttled"] += 1
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, GetUpdates): # Long polling chegaraga kirmaydi
+            return await make_request(bot, method)
+        with tracer.stage(f"tg:{type(method).__name__}"): # Chegara kutishi va 429 qayta urinishlari bilan
+            for attempt in range(self.retries + 1):
+                await self._take()
+                self.counts["calls"] += 1
+                try:
+                    return await make_request(bot, method)
+                except TelegramRetryAfter as e:
+                    self.counts["retry_after"] += 1
+                    self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+                    if attempt == self.retries: raise
+
+@st.cache_resource
+def get_tg_limiter():
+    return TelegramLimiter(TG_RATE, TG_RETRIES)
+
+tg_limiter = get_tg_limiter()
+
+class ProgressEditor:
+    """Progress xabarlarini birlashtiradi: o'zgarmagan matn yuborilmaydi, bitta chatda tahrirlar
+    orasida kamida interval soniya o'tadi; oraliqda kelgan holatlardan faqat oxirgisi yuboriladi"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last_at = {}  # chat_id -> oxirgi tahrir vaqti
+        self.pending = {}  # (chat_id, message_id) -> {"text", "sent", "task"}
+
+    async def update(self, chat_id, message_id, text, final=False):
+        p = self.pending.setdefault((chat_id, message_id), {"text": None, "sent": None, "task": None})
+        p["text"] = text
+        if text == p["sent"]: return
+        wait = self.last_at.get(chat_id, 0.0) + self.interval - time.monotonic()
+        if final or wait <= 0:
+            if p["task"]: p["task"].cancel(); p["task"] = None
+            await self._flush(chat_id, message_id)
+        elif p["task"] is None:
+            p["task"] = asyncio.create_task(self._later(chat_id, message_id, wait))
+
+    async def _later(self, chat_id, message_id, wait):
+        await asyncio.sleep(wait)
+        p = self.pending.get((chat_id, message_id))
+        if p: p["task"] = None
+        await self._flush(chat_id, message_id)
+
+    async def _flush(self, chat_id, message_id):
+        p = self.pending.get((chat_id, message_id))
+        if not p or p["text"] == p["sent"]: return
+        p["sent"] = p["text"]
+        self.last_at[chat_id] = time.monotonic()
+        try: await bot.edit_message_text(p["text"], chat_id=chat_id, message_id=message_id)
+        except TelegramBadRequest: pass # Xabar o'chirilgan yoki matn o'zgarmagan
+        except Exception as e: print(f"Progress Error: {e}")
+
+    def close(self, chat_id, message_id):
+        """Xabar bilan ish tugadi: kutilayotgan tahrirni bekor qilish"""
+        p = self.pending.pop((chat_id, message_id), None)
+        if p and p["task"]: p["task"].cancel()
 
 @st.cache_resource
-def load_local_whisper():
-    # 'base' modeli aniqlik va tezlik balansi uchun tanlangan
-    return whisper.load_model("base")
+def get_bot():
+    b = Bot(token=BOT_TOKEN)
+    b.session.middleware(tg_limiter)
+    return b
+
+bot = get_bot()
+dp = Dispatcher()
 
-model_local = load_local_whisper()
-bot = telebot.TeleBot(BOT_TOKEN)
+@dp.update.outer_middleware()
+async def cold_start_marks(handler, event, data):
+    # Uyg'ongandan keyingi birinchi xabar va unga javob tayyor bo'lgan vaqt
+    mark("birinchi_xabar")
+    try: return await handler(event, data)
+    finally: mark("birinchi_javob")
+progress = ProgressEditor(PROGRESS_EDIT_SEC)
+bot_me = {} # Bot ma'lumotlari ishga tushishda bir marta olinadi
+
+@st.cache_resource
+def get_sessions():
+    # Rejim va tahlil tanlovlari (fayl id, til, ko'rinish); qayta ishga tushirishdan keyin ham saqlanadi
+    return SessionStore(SESSION_DB, "bot_sessions", ttl=SESSION_TTL_HOURS * 3600, max_live=SESSION_MAX_LIVE)
+
+sessions = get_sessions()
+
+def user_mode(uid):
+    return sessions.state(uid).get("mode", "groq")
 
 # Streamlit interfeysi
 st.set_page_config(page_title="Neon Hybrid Server", layout="centered")
 st.title("🤖 Neon Hybrid Bot Server")
 st.success("Server va Bot faol holatda!")
+for _mode, _st in scheduler.stats().items():
+    st.write(f"**{_mode.upper()}:** navbatda {_st['navbatda']} | ishlamoqda {_st['ishlamoqda']}/{_st['limit']}")
+st.caption(f"Lokal dvigatel: {WHISPER_MODEL}{' (int8)' if WHISPER_INT8 else ''} | {LOCAL_PROCS} jarayon x {TORCH_THREADS} oqim")
+_rtf = engine_stats.report()
+if _rtf: st.table(_rtf)
+if race_stats.counts["races"]:
+    st.write("**Race rejimi:**", race_stats.report())
+_health = groq_backend.health()
+st.write(f"**Groq holati:** {_health['state']} | xatolar ulushi {_health['failure_rate']:.1%} | "
+         f"ok {_health['ok']}, xato {_health['fail']}, qayta urinish {_health['retry']}, rad etilgan {_health['rejected']}, lokalga o'tkazilgan {_health['fallback']}, "
+         f"yaroqsiz so'rov {_health['bad_request']}")
+st.write(f"**Sessiyalar:** {sessions.stats()}")
+_tg = tg_limiter.counts
+st.write(f"**Telegram API:** so'rovlar {_tg['calls']} | navbatda kutganlar {_tg['throttled']} | 429 javoblar {_tg['retry_after']}")
+_cold = cold_start_report()
+st.write(f"**Sovuq start (jarayon boshidan, s):** {_cold['bosqichlar']}")
+st.caption(f"Kechiktirilgan importlar (s): {_cold['importlar']}")
+tracer.gauge("vazifalar", lambda: {m: s["navbatda"] for m, s in scheduler.stats().items()})
+tracer.gauge("sessiyalar", lambda: sessions.stats()["xotirada"])
+if TRACING:
+    _trace = tracer.snapshot()
+    st.write(f"**Hovuzlar:** {_trace['hovuzlar']} | **Navbatlar:** {_trace['navbatlar']}")
+    if _trace["bosqichlar"]: st.table(_trace["bosqichlar"])
+    st.download_button("⬇️ Kuzatuv (JSON)", tracer.to_json(), file_name="bot_trace.json", mime="application/json")
 
-user_settings = {} # Rejimni saqlash
-user_data = {}     # Tahlil ma'lumotlarini saqlash
+MODE_LABELS = {"groq": "⚡ Groq", "local": "🎧 Whisper", "race": "🏁 Race"}
 
 # --- 2. MENU VA KLAVIATURA ---
 def main_menu_markup(uid):
-    menu = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    menu.add(types.KeyboardButton("⚡ Groq Rejimi"), types.KeyboardButton("🎧 Whisper Rejimi"))
-    menu.add(types.KeyboardButton("🌐 Saytga kirish (Login)"), types.KeyboardButton("ℹ️ Yordam"))
+    kb = [[KeyboardButton(text="⚡ Groq Rejimi"), KeyboardButton(text="🎧 Whisper Rejimi")],
+          [KeyboardButton(text="🏁 Race Rejimi")],
+          [KeyboardButton(text="🌐 Saytga kirish (Login)"), KeyboardButton(text="ℹ️ Yordam")]]
     if uid == ADMIN_ID:
-        menu.add(types.KeyboardButton("🔑 Admin Panel"))
-    return menu
+        kb.append([KeyboardButton(text="🔑 Admin Panel")])
+    return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
+
+async def send_long(chat_id, text, limit=4000):
+    """Uzun matnni Telegram chegarasiga sig'adigan qismlarga bo'lib yuboradi"""
+    for i in range(0, len(text), limit):
+        await bot.send_message(chat_id, text[i:i + limit])
 
 # --- 3. BOT FUNKSIYALARI ---
 
-@bot.message_handler(commands=['start'])
-def welcome(m):
-    count = log_user_and_get_count(m)
-    user_settings[m.chat.id] = user_settings.get(m.chat.id, "groq")
-    
-    mode_text = "⚡ Groq (Tezkor)" if user_settings[m.chat.id] == "groq" else "🎧 Whisper (Basic)"
+@dp.message(Command("start"))
+async def welcome(m: types.Message):
+    count = await log_user_and_get_count(m)
+    mode_text = {"groq": "⚡ Groq (Tezkor)", "local": "🎧 Whisper (Basic)", "race": "🏁 Race (Groq + Whisper)"}[user_mode(m.chat.id)]
     
     msg = (
         f"👋 **Assalomu alaykum!**\n\n"
@@ -107,202 +775,267 @@ def welcome(m):
         "Men audio va ovozli xabarlarni matnga aylantirib beruvchi aqlli botman.\n\n"
         "🚀 **Imkoniyatlar:**\n"
         "• **Groq Rejimi:** Dunyodagi eng tezkor tahlil.\n"
-        "• **Whisper Rejimi:** Pauzalarga asoslangan ritmik tahlil.\n\n"
+        "• **Whisper Rejimi:** Pauzalarga asoslangan ritmik tahlil.\n"
+        "• **Race Rejimi:** Qisqa ovozli xabarlar uchun Groq va Whisper bellashuvi, qaysi biri tez bo'lsa.\n\n"
         f"💡 Hozirgi rejim: **{mode_text}**\n\n"
         "Boshlash uchun audio yuboring!"
     )
-    bot.send_message(m.chat.id, msg, parse_mode="Markdown", reply_markup=main_menu_markup(m.chat.id))
+    await m.answer(msg, parse_mode="Markdown", reply_markup=main_menu_markup(m.chat.id))
 
 # ADMIN PANEL
-@bot.message_handler(func=lambda m: m.text == "🔑 Admin Panel" and m.chat.id == ADMIN_ID)
-def admin_panel(m):
-    markup = types.InlineKeyboardMarkup()
-    markup.add(types.InlineKeyboardButton("💬 Chatda ro'yxat", callback_data="adm_chat"),
-               types.InlineKeyboardButton("📁 TXT faylda", callback_data="adm_txt"))
-    bot.send_message(m.chat.id, "Admin panelga xush kelibsiz. Foydalanuvchilar ro'yxatini qanday olishni xohlaysiz?", reply_markup=markup)
-
-@bot.message_handler(func=lambda m: m.text in ["⚡ Groq Rejimi", "🎧 Whisper Rejimi"])
-def change_mode(m):
+@dp.message(F.text == "🔑 Admin Panel", F.chat.id == ADMIN_ID)
+async def admin_panel(m: types.Message):
+    markup = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="💬 Chatda ro'yxat", callback_data="adm_chat"),
+        InlineKeyboardButton(text="📁 TXT faylda", callback_data="adm_txt")]])
+    await m.answer("Admin panelga xush kelibsiz. Foydalanuvchilar ro'yxatini qanday olishni xohlaysiz?", reply_markup=markup)
+
+@dp.message(F.text.in_(["⚡ Groq Rejimi", "🎧 Whisper Rejimi", "🏁 Race Rejimi"]))
+async def change_mode(m: types.Message):
     if "Groq" in m.text:
-        user_settings[m.chat.id] = "groq"
-        bot.send_message(m.chat.id, "✅ **Groq Rejimi tanlandi!**\nTahlillar o'ta tezkor amalga oshiriladi.")
+        sessions.update(m.chat.id, mode="groq")
+        await m.answer("✅ **Groq Rejimi tanlandi!**\nTahlillar o'ta tezkor amalga oshiriladi.")
+    elif "Race" in m.text:
+        sessions.update(m.chat.id, mode="race")
+        await m.answer(f"✅ **Race Rejimi tanlandi!**\nGroq {RACE_HEDGE_DELAY:g} soniyada javob bermasa, Whisper ham ishga tushadi va birinchi tayyor natija yuboriladi ({RACE_MAX_SEC} soniyagacha bo'lgan audiolar uchun).")
     else:
-        user_settings[m.chat.id] = "local"
-        bot.send_message(m.chat.id, "✅ **Whisper Rejimi tanlandi!**\nMatnlar ritmga ko'ra bo'linadi (Navbat bo'lishi mumkin).")
+        sessions.update(m.chat.id, mode="local")
+        await m.answer("✅ **Whisper Rejimi tanlandi!**\nMatnlar ritmga ko'ra bo'linadi (Navbat bo'lishi mumkin).")
 
-@bot.message_handler(content_types=['audio', 'voice'])
-def audio_handler(m):
-    if m.chat.id not in user_settings: user_settings[m.chat.id] = "groq"
-    user_data[m.chat.id] = {'m_ids': [m.message_id]}
-    
-    markup = types.InlineKeyboardMarkup(row_width=2)
-    markup.add(
-        types.InlineKeyboardButton("📄 Original", callback_data="lang_orig"),
-        types.InlineKeyboardButton("🇺🇿 O'zbekcha", callback_data="lang_uz"),
-        types.InlineKeyboardButton("🇷🇺 Ruscha", callback_data="lang_ru")
-    )
-    mode = "⚡ Groq" if user_settings[m.chat.id] == "groq" else "🎧 Whisper"
-    bot.send_message(m.chat.id, f"🎯 **Tanlangan rejim:** {mode}\n\n🌍 **Tarjima tilini tanlang:**\n(Til tanlansa, har bir gapdan so'ng qavs ichida tarjimasi qo'shiladi)", reply_markup=markup)
+@dp.message(F.audio | F.voice)
+async def audio_handler(m: types.Message):
+    markup = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📄 Original", callback_data="lang_orig"),
+         InlineKeyboardButton(text="🇺🇿 O'zbekcha", callback_data="lang_uz")],
+        [InlineKeyboardButton(text="🇷🇺 Ruscha", callback_data="lang_ru")]
+    ])
+    mode = MODE_LABELS[user_mode(m.chat.id)]
     
-    user_data[m.chat.id]['fid'] = m.audio.file_id if m.content_type == 'audio' else m.voice.file_id
-    user_data[m.chat.id]['fname'] = m.audio.file_name if m.content_type == 'audio' else f"audio_{get_uz_time()}.ogg"
+    media = m.audio or m.voice
+    try: check_size(media.file_size, MAX_AUDIO_MB * 1024 * 1024)
+    except FileTooLarge:
+        await m.answer(f"❌ Fayl juda katta (limit: {MAX_AUDIO_MB} MB).")
+        return
+    sessions.update(m.chat.id, m_ids=[m.message_id], fid=media.file_id, fuid=media.file_unique_id,
+                    fname=m.audio.file_name if m.audio else f"audio_{get_uz_time()}.ogg", lang=None, view=None)
+    await m.answer(f"🎯 **Tanlangan rejim:** {mode}\n\n🌍 **Tarjima tilini tanlang:**\n(Til tanlansa, har bir gapdan so'ng qavs ichida tarjimasi qo'shiladi)", reply_markup=markup)
 
-@bot.callback_query_handler(func=lambda call: True)
-def callback_query(call):
+@dp.callback_query(F.data)
+async def callback_query(call: types.CallbackQuery):
     chat_id = call.message.chat.id
-    global waiting_users
+    if call.data.startswith(("lang_", "view_", "fmt_")) and not sessions.state(chat_id).get('fid'):
+        await call.message.edit_text("⌛️ Sessiya muddati tugagan. Iltimos, audioni qaytadan yuboring.")
+        return
     
     # 1. Tilni tanlash
     if call.data.startswith("lang_"):
-        user_data[chat_id]['lang'] = call.data.replace("lang_", "")
-        markup = types.InlineKeyboardMarkup(row_width=1)
-        markup.add(types.InlineKeyboardButton("⏱ Vaqt bo'yicha bo'lingan (Split)", callback_data="view_split"),
-                   types.InlineKeyboardButton("📖 Butun matn (Full Context)", callback_data="view_full"))
-        bot.edit_message_text("📄 **Matn ko'rinishini tanlang:**", chat_id, call.message.message_id, reply_markup=markup)
+        sessions.update(chat_id, lang=call.data.replace("lang_", ""))
+        markup = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="⏱ Vaqt bo'yicha bo'lingan (Split)", callback_data="view_split")],
+            [InlineKeyboardButton(text="📖 Butun matn (Full Context)", callback_data="view_full")]])
+        await call.message.edit_text("📄 **Matn ko'rinishini tanlang:**", reply_markup=markup)
         
     # 2. Ko'rinishni tanlash
     elif call.data.startswith("view_"):
-        user_data[chat_id]['view'] = call.data.replace("view_", "")
-        markup = types.InlineKeyboardMarkup(row_width=2)
-        markup.add(types.InlineKeyboardButton("📁 TXT Fayl", callback_data="fmt_txt"),
-                   types.InlineKeyboardButton("💬 Chatda olish", callback_data="fmt_chat"))
-        bot.edit_message_text("📁 **Formatni tanlang:**", chat_id, call.message.message_id, reply_markup=markup)
+        sessions.update(chat_id, view=call.data.replace("view_", ""))
+        markup = InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="📁 TXT Fayl", callback_data="fmt_txt"),
+            InlineKeyboardButton(text="💬 Chatda olish", callback_data="fmt_chat")]])
+        await call.message.edit_text("📁 **Formatni tanlang:**", reply_markup=markup)
 
     # 3. Admin callbacklari
     elif call.data.startswith("adm_"):
-        if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, "r", encoding="utf-8") as f:
-                content = f.read()
+        if len(user_store):
             if call.data == "adm_chat":
-                bot.send_message(ADMIN_ID, f"📑 **Foydalanuvchilar:**\n\n{content[:4000]}")
+                content = ""
+                for page in user_store.pages(100):
+                    content += "".join(page)
+                    if len(content) >= 4000: break
+                await bot.send_message(ADMIN_ID, f"📑 **Foydalanuvchilar:**\n\n{content[:4000]}")
             else:
-                with open("users.txt", "w", encoding="utf-8") as f: f.write(content)
-                with open("users.txt", "rb") as f: bot.send_document(ADMIN_ID, f, caption="📂 To'liq ro'yxat")
-                os.remove("users.txt")
-        else: bot.send_message(ADMIN_ID, "Baza bo'sh.")
+                def export():
+                    buf = io.StringIO()
+                    for page in user_store.pages(): buf.writelines(page)
+                    return buf.getvalue().encode("utf-8")
+                content = await asyncio.to_thread(export)
+                await bot.send_document(ADMIN_ID, BufferedInputFile(content, filename="users.txt"), caption="📂 To'liq ro'yxat")
+        else: await bot.send_message(ADMIN_ID, "Baza bo'sh.")
 
     # 4. Yakuniy tahlil boshlash
     elif call.data.startswith("fmt_"):
         fmt = call.data.replace("fmt_", "")
-        data = user_data[chat_id]
-        mode = user_settings[chat_id]
+        data = dict(sessions.state(chat_id))
+        mode = data.get("mode", "groq")
         
-        try: bot.delete_message(chat_id, call.message.message_id)
+        try: await call.message.delete()
         except: pass
         
-        waiting_users += 1
-        wait_msg = bot.send_message(chat_id, f"⏳ **Siz navbatdasiz.**\nSizdan oldin: {waiting_users-1} kishi bor.\nRejim: {mode.upper()}")
-
-        def process_task():
-            global waiting_users
-            with processing_lock:
-                # Progress Bar funksiyasi
-                def update_progress(percent, status_text):
-                    bar_len = 10
-                    filled = int(percent / 10)
-                    bar = "▓" * filled + "░" * (bar_len - filled)
-                    progress_msg = f"🛰 **TAHLIL REJIMIDAGI HOLAT: {mode.upper()}**\n\n{status_text}\n\n📊 Progress: {percent}%\n{bar}"
-                    try: bot.edit_message_text(progress_msg, chat_id, wait_msg.message_id)
-                    except: pass
+        ahead = scheduler.position(mode, chat_id)
+        wait_msg = await bot.send_message(chat_id, f"⏳ **Siz navbatdasiz.**\nSizdan oldin: {ahead} ta vazifa bor.\nRejim: {mode.upper()}")
 
-                try:
+        async def process_task():
+            # Progress Bar funksiyasi
+            async def update_progress(percent, status_text, final=False):
+                bar_len = 10
+                filled = int(percent / 10)
+                bar = "▓" * filled + "░" * (bar_len - filled)
+                progress_msg = f"🛰 **TAHLIL REJIMIDAGI HOLAT: {mode.upper()}**\n\n{status_text}\n\n📊 Progress: {percent}%\n{bar}"
+                await progress.update(chat_id, wait_msg.message_id, progress_msg, final)
+
+            lang_code = {"uz": "uz", "ru": "ru"}.get(data['lang'])
+            tail = [""] # Full rejimida hali tugallanmagan gap (keyingi bo'lak bilan davom etadi)
+
+            async def render(segs, final=False):
+                """Tayyor segmentlarni tarjimasi bilan matnga aylantiradi"""
+                if data['view'] == "split":
+                    # Vaqt bo'yicha bo'lingan
+                    items = [(f"[{int(s['start']//60):02d}:{int(s['start']%60):02d}] ", s['text'].strip()) for s in segs]
+                    sep = "\n\n"
+                else:
+                    # Butun yaxlit matn: gaplarga regex orqali bo'lish
+                    raw = " ".join([tail[0]] + [s['text'].strip() for s in segs]).strip()
+                    sentences = [sent for sent in re.split(r'(?<=[.!?])\s+', raw) if sent]
+                    tail[0] = sentences.pop() if sentences and not final and not sentences[-1].endswith(('.', '!', '?')) else ""
+                    items = [("", sent) for sent in sentences]
+                    sep = " "
+                texts = [t for _, t in items]
+                if lang_code and texts:
+                    with tracer.stage("tarjima_jami"): trs = await asyncio.to_thread(translate_texts, texts, lang_code)
+                else: trs = texts
+                return "".join(f"{pre}{t} ({tr}){sep}" if lang_code else f"{pre}{t}{sep}" for (pre, t), tr in zip(items, trs))
+
+            try:
+                # Avval keshdan qidirish: bu audio shu rejimda oldin tahlil qilingan bo'lsa, yuklab olish shart emas.
+                # Race rejimi uchun istalgan dvigatel natijasi mos keladi
+                engines = ("groq", "local") if mode == "race" else (mode,)
+                def from_cache(key):
+                    return next((segs for segs in (transcript_cache.get(key, e) for e in engines) if segs is not None), None)
+
+                keys = [data['fuid']] if data.get('fuid') else []
+                segments = await asyncio.to_thread(from_cache, keys[0]) if keys else None
+
+                if segments is None:
                     # Yuklab olish
-                    for p in range(0, 25, 5): 
-                        update_progress(p, "📥 Fayl serverga yuklanmoqda...")
-                        time.sleep(0.3)
-                        
-                    f_info = bot.get_file(data['fid'])
-                    down = bot.download_file(f_info.file_path)
-                    path = f"tmp_{chat_id}.mp3"
-                    with open(path, "wb") as f: f.write(down)
-                    
-                    # Tahlil jarayoni
-                    update_progress(30, "🧠 AI model ishga tushmoqda...")
-                    
-                    segments = []
-                    if mode == "groq":
-                        try:
-                            with open(path, "rb") as f:
-                                res = client_groq.audio.transcriptions.create(
-                                    file=(path, f.read()), model="whisper-large-v3-turbo", response_format="verbose_json"
-                                )
-                            segments = res.segments
-                        except:
-                            bot.send_message(chat_id, "⚠️ Groq API hozir charchagan. Iltimos birozdan so'ng urinib ko'ring yoki **Whisper Rejimi**ga o'ting!", reply_markup=main_menu_markup(chat_id))
-                            return
-                    else:
-                        # Local Whisper
-                        res = model_local.transcribe(path)
-                        segments = res['segments']
-
-                    for p in range(40, 95, 10):
-                        update_progress(p, "✍️ Matn imlo qoidalari asosida yig'ilmoqda...")
-                        time.sleep(0.5)
-
-                    # Matnni shakllantirish
-                    lang_code = {"uz": "uz", "ru": "ru"}.get(data['lang'])
-                    final_text = ""
-                    
-                    if data['view'] == "split":
-                        # Vaqt bo'yicha bo'lingan
-                        for s in segments:
-                            tm = f"[{int(s['start']//60):02d}:{int(s['start']%60):02d}]"
-                            txt = s['text'].strip()
-                            if lang_code:
-                                tr = GoogleTranslator(source='auto', target=lang_code).translate(txt)
-                                final_text += f"{tm} {txt} ({tr})\n\n"
-                            else:
-                                final_text += f"{tm} {txt}\n\n"
-                    else:
-                        # Butun yaxlit matn
-                        raw_full = " ".join([s['text'].strip() for s in segments])
-                        # Gaplarga regex orqali bo'lish
-                        sentences = re.split(r'(?<=[.!?])\s+', raw_full)
-                        for sent in sentences:
-                            if not sent: continue
-                            if lang_code:
-                                tr = GoogleTranslator(source='auto', target=lang_code).translate(sent)
-                                final_text += f"{sent} ({tr}) "
-                            else:
-                                final_text += f"{sent} "
-                        final_text = final_text.strip()
-
-                    update_progress(100, "✅ Tahlil yakunlandi!")
-                    time.sleep(0.5)
-
-                    # Imzo (Signature)
-                    footer = (
-                        f"\n\n---\n"
-                        f"👤 Dasturchi: @Otavaliyev_M\n"
-                        f"🤖 Bot useri: @{bot.get_me().username}\n"
-                        f"⚙️ Rejim: {mode.upper()}\n"
-                        f"⏰ Vaqt: {get_uz_time()} (UZB)"
-                    )
-                    
+                    await update_progress(0, "📥 Fayl serverga yuklanmoqda...")
+                    # Zaxira kalit: fayl mazmunining xeshi (boshqa file_unique_id bilan kelgan bir xil audio uchun),
+                    # bo'laklar yuklanishi bilan hisoblanadi
+                    sha = hashlib.sha256()
+                    with tracer.stage("yuklash"):
+                        down = await fetch_file(bot, data['fid'], MAX_AUDIO_MB * 1024 * 1024, DOWNLOAD_SPOOL_MB * 1024 * 1024, digest=sha)
+                    keys.append("sha_" + sha.hexdigest())
+                    segments = await asyncio.to_thread(from_cache, keys[-1])
+                    if segments is not None: down.close()
+
+                if segments is None:
+                    await update_progress(1, "🧠 AI model ishga tushmoqda...")
+                    # 16 kHz mono ga o'tkazish: diskdagi faylni ffmpeg o'zi o'qiydi, xotiradagisi nusxasiz beriladi
+                    def decode(spool):
+                        with spool:
+                            if spool.on_disk: return decode_audio(spool)
+                            with spool.view() as buf: return decode_audio(buf)
+                    with tracer.stage("dekodlash"): audio = await asyncio.to_thread(decode, down)
+                    down = None
+                    total = len(audio) / SAMPLE_RATE
+                    stream, cached = transcribe_stream(audio, mode), False
+                else:
+                    await update_progress(1, "♻️ Bu audio avval tahlil qilingan, natija keshdan olindi.")
+                    total = segments[-1]['end'] if segments else 0
+                    async def from_segments():
+                        yield segments, total, None
+                    stream, cached = from_segments(), True
+
+                # Tahlil jarayoni: har bir bo'lak tayyor bo'lishi bilan matnga aylantirib, chatga yuborib boramiz
+                all_segments, parts, pending, flushed = [], [], "", False
+                used, fallback = set(), False # Bo'laklarni qaysi dvigatellar tahlil qildi ("groq" / "local")
+                try:
+                    async for segs, done, model in stream:
+                        all_segments += segs
+                        if model: used.add("groq" if model.startswith("groq:") else "local")
+                        # Groq ishlamay, bo'laklardan biri lokal Whisper'da tahlil qilindimi
+                        fallback = mode == "groq" and "local" in used
+                        piece = await render(segs)
+                        parts.append(piece)
+                        pending += piece
+                        if fmt == "chat" and pending.strip() and (len(pending) >= STREAM_FLUSH_CHARS or not flushed):
+                            await send_long(chat_id, pending.strip())
+                            pending, flushed = "", True
+                        pct = min(99, int(done / total * 100)) if total else 99
+                        note = "\n⚠️ Groq javob bermadi, lokal Whisper bilan davom etilmoqda." if fallback else ""
+                        await update_progress(pct, f"🧠 Tahlil qilinmoqda: {int(done//60):02d}:{int(done%60):02d} / {int(total//60):02d}:{int(total%60):02d}{note}")
+                except GroqUnavailable:
+                    await bot.send_message(chat_id, "⚠️ Groq API hozir charchagan. Iltimos birozdan so'ng urinib ko'ring yoki **Whisper Rejimi**ga o'ting!", reply_markup=main_menu_markup(chat_id))
+                    return
+                finally:
+                    await stream.aclose()
+
+                piece = await render([], final=True)
+                parts.append(piece)
+                pending += piece
+                # Aralash (qisman lokal) natija keshga yozilmaydi; yaxlit natija uni haqiqatda bergan dvigatel nomi bilan
+                # saqlanadi (Groq rejimida to'liq lokalga o'tgan natija "groq" bo'lib keshlanmasligi uchun)
+                if not cached and len(used) == 1:
+                    await asyncio.to_thread(transcript_cache.put, keys, next(iter(used)), all_segments)
+                final_text = "".join(parts)
+                if data['view'] != "split": final_text = final_text.strip()
+
+                await update_progress(100, "✅ Tahlil yakunlandi!", final=True)
+
+                # Imzo (Signature)
+                me = bot_me["me"]
+                engine_note = " → LOCAL" if fallback else (f" ({'+'.join(sorted(used)).upper()})" if mode == "race" and used else "")
+                footer = (
+                    f"\n\n---\n"
+                    f"👤 Dasturchi: @Otavaliyev_M\n"
+                    f"🤖 Bot useri: @{me.username}\n"
+                    f"⚙️ Rejim: {mode.upper()}{engine_note}\n"
+                    f"⏰ Vaqt: {get_uz_time()} (UZB)"
+                )
+                
+                with tracer.stage("natija_yuborish"):
                     if fmt == "txt":
-                        with open(f"res_{chat_id}.txt", "w", encoding="utf-8") as f: 
-                            f.write(final_text + footer)
-                        with open(f"res_{chat_id}.txt", "rb") as f:
-                            bot.send_document(chat_id, f, caption=f"Tayyor! \nBot: @{bot.get_me().username}")
-                        os.remove(f"res_{chat_id}.txt")
+                        doc = BufferedInputFile((final_text + footer).encode("utf-8"), filename=f"res_{chat_id}.txt")
+                        await bot.send_document(chat_id, doc, caption=f"Tayyor! \nBot: @{me.username}")
                     else:
-                        if len(final_text + footer) > 4000:
-                            bot.send_message(chat_id, (final_text + footer)[:4000])
-                            bot.send_message(chat_id, (final_text + footer)[4000:])
-                        else:
-                            bot.send_message(chat_id, final_text + footer)
+                        # Oldin yuborilmagan qolgan matn va imzo
+                        await send_long(chat_id, (pending.strip() + footer).strip())
 
-                    # Avto tozalash
-                    bot.delete_message(chat_id, wait_msg.message_id)
-                    if os.path.exists(path): os.remove(path)
+                # Avto tozalash
+                await bot.delete_message(chat_id, wait_msg.message_id)
 
-                except Exception as e:
-                    bot.send_message(chat_id, f"❌ Xatolik: {e}\nIltimos, boshqa rejimni tanlab ko'ring.")
-                finally:
-                    waiting_users -= 1
+            except Exception as e:
+                await bot.send_message(chat_id, f"❌ Xatolik: {e}\nIltimos, boshqa rejimni tanlab ko'ring.")
+            finally:
+                progress.close(chat_id, wait_msg.message_id)
+
+        scheduler.submit(mode, chat_id, process_task)
 
-        threading.Thread(target=process_task).start()
+# --- 4. RUNNER ---
+def run_bot():
+    """Botni alohida thread ichidagi o'z event loop'ida ishga tushirish"""
+    try:
+        new_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(new_loop)
 
-# Pollingni alohida thread'da ishga tushirish
-threading.Thread(target=bot.infinity_polling, daemon=True).start()
+        async def runner():
+            bot_me["me"] = await bot.get_me()
+            scheduler.start()
+            mark("bot_tayyor")
+            await dp.start_polling(bot, handle_signals=False)
+
+        new_loop.run_until_complete(runner())
+    except Exception as e:
+        print(f"Bot Error: {e}")
+
+BOT_THREAD = "AiogramThread-audio"
+
+@st.cache_resource
+def start_bot():
+    """Bot jarayonda bir marta ishga tushadi: Streamlit rerun'lari (sahifa ochilishi, keep-alive) unga tegmaydi.
+    Kesh tozalansa ham ikkinchi polling ochilmasligi uchun ishlab turgan thread tekshiriladi"""
+    t = next((t for t in threading.enumerate() if t.name == BOT_THREAD), None)
+    if t is None:
+        t = threading.Thread(target=run_bot, name=BOT_THREAD, daemon=True)
+        t.start()
+    return t
 
+start_bot()
@@ -0,0 +1,83 @@
+"""Rasm sifatini oshirish: rasm ustma-ust tushadigan bo'laklarga (tile) bo'linib, jarayonlar hovuzida ishlanadi.
+
+Hovuzdagi funksiyalar alohida modulda turadi, chunki Streamlit skriptida e'lon qilingan
+funksiyalarni boshqa jarayonga uzatib bo'lmaydi. Hovuz "fork" bilan ochiladi (spawn skriptni qayta bajaradi).
+"""
+import asyncio
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+TILE = 512
+OVERLAP = 16 # NLM qidiruv oynasi (21) radiusidan katta: bo'laklar chegarasida chok qolmaydi
+
+# PIL ImageFilter.SMOOTH yadrosi: ImageEnhance.Sharpness shu bilan aralashtiradi
+_SMOOTH = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], np.float32) / 13
+
+# quality - oldingi to'liq NLM; fast - arzon bilateral filtr
+PRESETS = {
+    "quality": lambda t: cv2.fastNlMeansDenoisingColored(t, None, 10, 10, 7, 21),
+    "fast": lambda t: cv2.bilateralFilter(t, 7, 40, 40),
+}
+
+def _init_worker():
+    cv2.setNumThreads(1) # Parallellik jarayonlar darajasida; har biri ichida OpenCV oqimlari ko'paymasin
+
+def enhance_tile(tile, preset, sharpness=1.5):
+    """Bitta bo'lak: shovqinni kamaytirish va keskinlash (PIL Sharpness bilan bir xil formula)"""
+    den = PRESETS[preset](tile)
+    smooth = cv2.filter2D(den, -1, _SMOOTH, borderType=cv2.BORDER_REPLICATE)
+    return cv2.addWeighted(den, sharpness, smooth, 1 - sharpness, 0)
+
+def _tiles(h, w):
+    for y in range(0, h, TILE):
+        for x in range(0, w, TILE):
+            yield y, x, min(y + TILE, h), min(x + TILE, w)
+
+def _prepare(img_bytes):
+    """Rasmni o'qib, ustma-ust tushadigan bo'laklarga ajratadi: (rasm, [(oy, ox, y0, x0, y1, x1, bo'lak), ...])"""
+    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+    h, w = img.shape[:2]
+    tiles = []
+    for y0, x0, y1, x1 in _tiles(h, w):
+        # Bo'lak qo'shnilari bilan OVERLAP qadar kengaytirib olinadi, natijadan faqat o'z qismi kesib olinadi
+        py0, px0, py1, px1 = max(0, y0 - OVERLAP), max(0, x0 - OVERLAP), min(h, y1 + OVERLAP), min(w, x1 + OVERLAP)
+        tiles.append((y0 - py0, x0 - px0, y0, x0, y1, x1, np.ascontiguousarray(img[py0:py1, px0:px1])))
+    return img, tiles
+
+def _finish(img, tiles, results, contrast, quality):
+    out = np.empty_like(img)
+    for (oy, ox, y0, x0, y1, x1, _), done in zip(tiles, results):
+        out[y0:y1, x0:x1] = done[oy:oy + y1 - y0, ox:ox + x1 - x0]
+    # Kontrast butun rasm o'rtacha yorqinligiga nisbatan (PIL Contrast bilan bir xil)
+    mean = int(cv2.cvtColor(out, cv2.COLOR_BGR2GRAY).mean() + 0.5)
+    out = cv2.addWeighted(out, contrast, np.full_like(out, mean), 1 - contrast, 0)
+    _, buf = cv2.imencode(".jpg", out, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+def enhance_image(img_bytes, preset="quality", contrast=1.2, quality=95):
+    """HD effekt shu jarayonning o'zida (hovuzsiz): bo'laklar ketma-ket ishlanadi, keyin butun rasmga kontrast beriladi.
+    (JPEG baytlar, sarflangan soniyalar, megapiksellar) qaytaradi"""
+    t = time.perf_counter()
+    img, tiles = _prepare(img_bytes)
+    results = [enhance_tile(tile[-1], preset) for tile in tiles]
+    return _finish(img, tiles, results, contrast, quality), time.perf_counter() - t, img.shape[0] * img.shape[1] / 1e6
+
+async def enhance_image_async(img_bytes, preset, pool, contrast=1.2, quality=95, track=None):
+    """enhance_image ning hovuzli asyncio varianti: bo'laklar parallel ishlanadi, natijasi oqimni band qilmasdan kutiladi
+    (faqat o'qish/kodlash qisqa vaqtga oqimga beriladi), shuning uchun ko'p rasmli albom umumiy executor'ni to'ldirmaydi.
+    track(future) - hovuzga yuborilgan har bir bo'lak uchun (kuzatuv)"""
+    t = time.perf_counter()
+    img, tiles = await asyncio.to_thread(_prepare, img_bytes)
+    futs = [pool.submit(enhance_tile, tile[-1], preset) for tile in tiles]
+    if track:
+        for f in futs: track(f)
+    results = await asyncio.gather(*[asyncio.wrap_future(f) for f in futs])
+    out = await asyncio.to_thread(_finish, img, tiles, results, contrast, quality)
+    return out, time.perf_counter() - t, img.shape[0] * img.shape[1] / 1e6
+
+def create_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("fork"), initializer=_init_worker)
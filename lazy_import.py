@@ -0,0 +1,54 @@
+"""Og'ir kutubxonalarni kechiktirib yuklash va sovuq start hisoboti.
+
+Modul birinchi ishlatilganda yuklanadi, shuning uchun uxlab qolgan ilova uyg'onganda bot
+torch, cv2, pdf2docx kabi kutubxonalarni kutmasdan ishga tushadi.
+Streamlit skriptni qayta bajarganda import qilingan modullar jarayonda qoladi: hisob jarayon umri bo'yi to'planadi.
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+
+def _process_start():
+    """Jarayon boshlangan vaqt (Linux: /proc dan), bo'lmasa shu modul yuklangan vaqt"""
+    try:
+        with open("/proc/self/stat") as f: ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f: boot = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, StopIteration):
+        return time.time()
+
+PROCESS_START = _process_start()
+_lock = threading.Lock()
+_imports = {} # modul -> birinchi yuklash soniyalari
+_events = {}  # hodisa -> jarayon boshidan soniyalar
+
+def load(name):
+    mod = sys.modules.get(name)
+    if mod is not None: return mod
+    t = time.perf_counter()
+    mod = importlib.import_module(name)
+    with _lock: _imports.setdefault(name, round(time.perf_counter() - t, 3))
+    return mod
+
+class LazyModule:
+    """Modul o'rniga turadi: birinchi atributga murojaatda haqiqiy modul yuklanadi"""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(load(self._name), attr)
+
+def lazy(name):
+    return LazyModule(name)
+
+def mark(event):
+    """Sovuq start bosqichi (masalan, bot tayyor, birinchi javob); faqat birinchi marta yoziladi"""
+    with _lock: _events.setdefault(event, round(time.time() - PROCESS_START, 2))
+
+def report():
+    with _lock:
+        return {"bosqichlar": dict(_events), "importlar": dict(sorted(_imports.items(), key=lambda kv: -kv[1]))}
@@ -5,28 +5,59 @@ import io
 import os
 import re
 import tempfile
-import cv2
 import html
 import json
-import numpy as np
-import img2pdf
-from PIL import Image, ImageEnhance
-from docx import Document
-from docx.shared import Inches
-from PyPDF2 import PdfReader, PdfWriter
-from pdf2docx import Converter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import simpleSplit
+import mmap
+import time
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from lazy_import import lazy, mark, report as cold_start_report
+from pdf_writer import PdfStreamWriter, invisible_text, pdf_string, wrap_line
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
-from aiogram.types import BufferedInputFile, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import BufferedInputFile, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaDocument
 from aiogram.client.default import DefaultBotProperties
-from google.cloud import vision
+from session_store import SessionStore, SessionQuotaError
+from tg_download import FileTooLarge, download as fetch_file
+from tracing import Tracer
+
+# Og'ir kutubxonalar shu yerda emas, birinchi ishlatilganda yuklanadi: uyg'ongan ilovada bot darhol javob beradi
+cv2 = lazy("cv2")
+np = lazy("numpy")
+img2pdf = lazy("img2pdf")
+docx = lazy("docx")
+PyPDF2 = lazy("PyPDF2")
+pagesizes = lazy("reportlab.lib.pagesizes")
+vision = lazy("google.cloud.vision")
+Image = lazy("PIL.Image")
+image_engine = lazy("image_engine") # cv2 bilan
+pdf_engine = lazy("pdf_engine")     # pdf2docx (PyMuPDF) bilan
+mark("skript_importlari")
 
 # --- 1. GLOBAL STORAGE ---
-if "G_DATA" not in globals():
-    G_DATA = {} 
+# Sessiyalar: holat SQLite'da, rasm va hujjatlar diskda; eski sessiyalar TTL bo'yicha o'chiriladi
+SESSION_TTL_HOURS = float(st.secrets.get("SESSION_TTL_HOURS", 24))
+SESSION_MAX_LIVE = int(st.secrets.get("SESSION_MAX_LIVE", 1000))
+USER_QUOTA_MB = int(st.secrets.get("USER_QUOTA_MB", 50))
+# Bosqichlar kechikishini kuzatish (o'chirilsa deyarli xarajatsiz)
+TRACING = str(st.secrets.get("TRACING", "true")).lower() in ("1", "true", "yes")
+
+@st.cache_resource
+def get_tracer():
+    return Tracer(TRACING)
+
+tracer = get_tracer()
+
+@st.cache_resource
+def get_sessions():
+    return SessionStore("vision_sessions.db", "vision_sessions", ttl=SESSION_TTL_HOURS * 3600,
+                        max_live=SESSION_MAX_LIVE, user_quota=USER_QUOTA_MB * 1024 * 1024)
+
+sessions = get_sessions()
 
 # --- 2. CONFIGURATION & AUTHENTICATION ---
 st.set_page_config(page_title="Google Vision AI Bot", layout="wide", page_icon="👁️")
@@ -62,93 +93,357 @@ except Exception as e:
 
 # --- 3. GOOGLE VISION ENGINE & EFFECTS ---
 
-def google_vision_scan(image_bytes):
-    """Google Cloud Vision API orqali matnni o'qish"""
+# Bitta batch_annotate_images so'rovidagi rasmlar soni (API chegarasi 16) va hajmi, parallel so'rovlar soni
+VISION_BATCH_SIZE = 16
+VISION_BATCH_MB = 8
+VISION_WORKERS = int(st.secrets.get("VISION_WORKERS", 4))
+
+@st.cache_resource
+def get_vision():
+    """Bitta doimiy klient (gRPC kanal va autentifikatsiya bir marta) va so'rovlar uchun cheklangan hovuz"""
+    tracer.pool("vision", VISION_WORKERS)
+    return vision.ImageAnnotatorClient(), ThreadPoolExecutor(max_workers=VISION_WORKERS)
+
+def _page_text(r):
+    return r.full_text_annotation.text if r.full_text_annotation.text else "Matn topilmadi."
+
+def _page_words(r):
+    """Qidiriladigan PDF uchun so'zlar va ularning qutilari (piksellarda), JSON: [[matn, x0, y0, x1, y1], ...]"""
+    words = []
+    for page in r.full_text_annotation.pages:
+        for block in page.blocks:
+            for par in block.paragraphs:
+                for word in par.words:
+                    xs = [v.x for v in word.bounding_box.vertices]; ys = [v.y for v in word.bounding_box.vertices]
+                    words.append(["".join(sym.text for sym in word.symbols), min(xs), min(ys), max(xs), max(ys)])
+    return json.dumps(words, ensure_ascii=False)
+
+# OCR natijasi turlari: butun matn yoki so'zlar qutilari bilan (keshda ham shu nom bilan saqlanadi)
+OCR_MODES = {"document": _page_text, "words": _page_words}
+
+def _vision_batch(images, extract=_page_text):
+    """Bitta so'rov bilan bir nechta rasmni o'qish; natijalar rasmlar tartibida"""
+    client, _ = get_vision()
+    # DOCUMENT_TEXT_DETECTION - eng kuchli rejim
+    feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
     try:
-        client = vision.ImageAnnotatorClient()
-        content = image_bytes
-        image = vision.Image(content=content)
-        # DOCUMENT_TEXT_DETECTION - eng kuchli rejim
-        response = client.document_text_detection(image=image)
-        
-        if response.error.message:
-            return f"❌ Google API Xatosi: {response.error.message}"
-            
-        return response.full_text_annotation.text if response.full_text_annotation else "Matn topilmadi."
+        with tracer.stage("vision_sorov"):
+            response = client.batch_annotate_images(requests=[
+                vision.AnnotateImageRequest(image=vision.Image(content=img), features=[feature]) for img in images])
     except Exception as e:
-        return f"❌ Tizim xatosi: {e}"
+        return [f"❌ Tizim xatosi: {e}"] * len(images)
+    return [f"❌ Google API Xatosi: {r.error.message}" if r.error.message else extract(r) for r in response.responses]
+
+def google_vision_scan_many(images, extract=_page_text):
+    """Ko'p sahifali OCR: sahifalar paketlarga bo'linib, paketlar parallel yuboriladi; tartib saqlanadi"""
+    batches, cur, size = [], [], 0
+    for img in images:
+        if cur and (len(cur) >= VISION_BATCH_SIZE or size + len(img) > VISION_BATCH_MB * 1024 * 1024):
+            batches.append(cur); cur, size = [], 0
+        cur.append(img); size += len(img)
+    if cur: batches.append(cur)
+    try: _, executor = get_vision()
+    except Exception as e: return [f"❌ Tizim xatosi: {e}"] * len(images)
+    futs = [tracer.track("vision", executor.submit(_vision_batch, b, extract)) for b in batches]
+    return [txt for f in futs for txt in f.result()]
+
+class OCRCache:
+    """OCR natijalari: (rasm mazmuni xeshi, rejim) bo'yicha SQLite'da, hajm oshsa eng uzoq ishlatilmaganlari o'chiriladi"""
+
+    def __init__(self, path, max_bytes):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS ocr (key TEXT, mode TEXT, text TEXT, size INTEGER, used REAL, PRIMARY KEY (key, mode))")
+        self.db.execute("CREATE INDEX IF NOT EXISTS ocr_used ON ocr (used)")
+        self.db.commit()
+        self.total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM ocr").fetchone()[0]
+        self.hits = self.misses = 0
+
+    def get_many(self, keys, mode):
+        found = {}
+        with self.lock:
+            for k in set(keys):
+                row = self.db.execute("SELECT text FROM ocr WHERE key=? AND mode=?", (k, mode)).fetchone()
+                if row: found[k] = row[0]
+            if found:
+                now = time.time()
+                self.db.executemany("UPDATE ocr SET used=? WHERE key=? AND mode=?", [(now, k, mode) for k in found])
+                self.db.commit()
+            self.hits += sum(k in found for k in keys)
+            self.misses += sum(k not in found for k in keys)
+        return found
+
+    def put_many(self, pairs, mode):
+        with self.lock:
+            now = time.time()
+            for k, text in pairs.items():
+                old = self.db.execute("SELECT size FROM ocr WHERE key=? AND mode=?", (k, mode)).fetchone()
+                size = len(text.encode("utf-8"))
+                self.db.execute("INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?)", (k, mode, text, size, now))
+                self.total += size - (old[0] if old else 0)
+            if self.total > self.max_bytes:
+                # Eng uzoq ishlatilmagan natijalarni o'chirish
+                drop = []
+                for rowid, size in self.db.execute("SELECT rowid, size FROM ocr ORDER BY used").fetchall():
+                    if self.total <= self.max_bytes: break
+                    drop.append((rowid,)); self.total -= size
+                self.db.executemany("DELETE FROM ocr WHERE rowid=?", drop)
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            n = self.hits + self.misses
+            return {"hit": self.hits, "miss": self.misses, "hit_ratio": round(self.hits / n, 3) if n else None,
+                    "hajm_mb": round(self.total / 1024 / 1024, 2)}
+
+@st.cache_resource
+def get_ocr_cache():
+    return OCRCache("ocr_cache.db", int(st.secrets.get("OCR_CACHE_MB", 100)) * 1024 * 1024)
+
+ocr_cache = get_ocr_cache()
+
+def ocr_pages(images, mode="document"):
+    """Keshdagi sahifalar darhol olinadi, faqat qolganlari Vision'ga yuboriladi; tartib saqlanadi"""
+    keys = [hashlib.sha256(img).hexdigest() for img in images]
+    found = ocr_cache.get_many(keys, mode)
+    missing = {k: img for k, img in zip(keys, images) if k not in found}
+    if missing:
+        texts = dict(zip(missing, google_vision_scan_many(list(missing.values()), OCR_MODES[mode])))
+        # Xatolar keshga yozilmaydi
+        ocr_cache.put_many({k: t for k, t in texts.items() if not t.startswith("❌")}, mode)
+        found.update(texts)
+    return [found[k] for k in keys]
+
+# HD effekt uchun jarayonlar soni
+IMAGE_PROCS = int(st.secrets.get("IMAGE_PROCS", os.cpu_count() or 2))
+
+@st.cache_resource
+def get_image_pool():
+    tracer.pool("hd_bolaklar", IMAGE_PROCS)
+    return image_engine.create_pool(IMAGE_PROCS)
+
+@st.cache_resource
+def get_enhance_stats():
+    return {"images": 0, "sec": 0.0, "mpix": 0.0}
+
+enhance_stats = get_enhance_stats()
+
+async def enhance_photo(img_bytes, preset="quality"):
+    """HD effekt: (JPEG baytlar, soniyalar). Bo'laklar jarayonlar hovuzida, kutish bot tsiklida:
+    albomdagi har bir rasm umumiy executor oqimini band qilib turmaydi.
+    Ishchi jarayon o'lsa (masalan, xotira yetmay), hovuz butunlay buziladi: u yangisiga almashtirilib, rasm bir marta qayta ishlanadi"""
+    for attempt in range(2):
+        pool = get_image_pool()
+        try:
+            with tracer.stage(f"hd:{preset}"):
+                out, sec, mpix = await image_engine.enhance_image_async(img_bytes, preset, pool,
+                                                                        track=lambda f: tracer.track("hd_bolaklar", f))
+            break
+        except BrokenProcessPool:
+            # Albomdagi boshqa rasm hovuzni allaqachon almashtirgan bo'lishi mumkin
+            if get_image_pool() is pool: get_image_pool.clear(); pool.shutdown(wait=False)
+            if attempt: raise
+    enhance_stats["images"] += 1; enhance_stats["sec"] += sec; enhance_stats["mpix"] += mpix
+    return out, sec
 
 def process_image_effect(img_bytes, effect="original"):
-    """Rasmga effekt berish (Oq-qora, HD)"""
-    nparr = np.frombuffer(img_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    
+    """Rasmga effekt berish (Oq-qora); HD effekt - enhance_photo"""
     if effect == "bw": # Oq-Qora (Skaner effekti)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        processed = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-        _, buf = cv2.imencode(".jpg", processed)
-        return buf.tobytes()
-        
-    elif effect == "enhance": # Sifatni oshirish
-        cleaned = cv2.fastNlMeansDenoisingColored(img, None, 10, 10, 7, 21)
-        pil_img = Image.fromarray(cv2.cvtColor(cleaned, cv2.COLOR_BGR2RGB))
-        enhancer = ImageEnhance.Sharpness(pil_img)
-        sharpened = enhancer.enhance(1.5)
-        contrast = ImageEnhance.Contrast(sharpened)
-        final_pil = contrast.enhance(1.2)
-        buf = io.BytesIO()
-        final_pil.save(buf, format="JPEG", quality=95)
-        return buf.getvalue()
+        with tracer.stage("cv2:bw"):
+            img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            processed = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+            # Haqiqiy 1-bitli rasm, CCITT G4 siqilgan TIFF: img2pdf uni qayta kodlamasdan PDF ga joylaydi
+            buf = io.BytesIO()
+            Image.fromarray(processed > 127).save(buf, format="TIFF", compression="group4")
+            return buf.getvalue()
         
     else: # Original
         return img_bytes
 
 # --- 4. CONVERTERS ---
+# Skaner PDF sahifalarini A4 ga keltirish (rasm nisbati saqlanadi)
+PDF_A4 = str(st.secrets.get("PDF_A4", "false")).lower() in ("1", "true", "yes")
+
+def scans_to_pdf(images):
+    with tracer.stage("img2pdf"):
+        if not PDF_A4: return img2pdf.convert(images)
+        layout = img2pdf.get_layout_fun((img2pdf.mm_to_pt(210), img2pdf.mm_to_pt(297)), fit=img2pdf.FitMode.into)
+        return img2pdf.convert(images, layout_fun=layout)
+
+def searchable_pdf(images, ocr_words):
+    """Skaner rasmlari (JPEG qayta kodlanmaydi) ustiga OCR so'zlari ko'rinmas qatlam qilib joylanadi.
+    ocr_words - ocr_pages(..., "words") natijasi, sahifalar tartibida"""
+    with tempfile.SpooledTemporaryFile(max_size=TEXT_PDF_SPOOL_MB * 1024 * 1024) as spool:
+        w = PdfStreamWriter(spool)
+        for img, words in zip(images, ocr_words):
+            im = Image.open(io.BytesIO(img))
+            iw, ih = im.size
+            if im.format != "JPEG" or im.mode not in ("RGB", "L"):
+                buf = io.BytesIO(); im.convert("RGB").save(buf, format="JPEG", quality=95); img = buf.getvalue()
+            # Sahifa o'lchami img2pdf kabi: rasm DPI si (yo'q bo'lsa 96), PDF_A4 bo'lsa A4 ga sig'diriladi
+            dpi = float(im.info.get("dpi", (96, 96))[0] or 96)
+            scale = 72 / (dpi if dpi >= 1 else 96)
+            pw, ph, ox, oy = iw * scale, ih * scale, 0.0, 0.0
+            if PDF_A4:
+                a4 = pagesizes.A4
+                scale *= min(a4[0] / pw, a4[1] / ph)
+                pw, ph = a4
+                ox, oy = (pw - iw * scale) / 2, (ph - ih * scale) / 2
+            im_id = w.add_image(img, iw, ih, b"/DeviceGray" if im.mode == "L" else b"/DeviceRGB")
+            boxes = [] if words.startswith("❌") else json.loads(words)
+            content = b"q %.2f 0 0 %.2f %.2f %.2f cm /Im0 Do Q\n" % (iw * scale, ih * scale, ox, oy) + invisible_text(boxes, scale, ox, oy, ih)
+            w.add_page(content, pw, ph, {"Im0": im_id})
+        w.close()
+        spool.seek(0)
+        return spool.read()
+
+# Matn -> PDF: 12 pt Helvetica, 40 pt hoshiya; diskka o'tadigan bufer chegarasi
+TEXT_PDF_SPOOL_MB = 8
 
-def create_pdf_from_text(text_content):
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    text_obj = p.beginText(40, height - 40)
-    text_obj.setFont("Helvetica", 12)
-    for line in text_content.split('\n'):
-        wrapped_lines = simpleSplit(line, "Helvetica", 12, width - 80)
-        for wrapped in wrapped_lines:
-            if text_obj.getY() < 40:
-                p.drawText(text_obj); p.showPage()
-                text_obj = p.beginText(40, height - 40); text_obj.setFont("Helvetica", 12)
-            text_obj.textLine(wrapped)
-    p.drawText(text_obj); p.save(); buffer.seek(0)
-    return buffer.getvalue()
-
-def docx_to_pdf_engine(docx_bytes):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tf:
-        tf.write(docx_bytes); path = tf.name
-    try:
-        doc = Document(path)
-        text = "\n".join([para.text for para in doc.paragraphs])
-        return create_pdf_from_text(text)
-    finally:
-        if os.path.exists(path): os.remove(path)
-
-def convert_pdf_to_docx_safe(pdf_bytes):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tf:
-        tf.write(pdf_bytes); temp_pdf = tf.name
-    temp_docx = temp_pdf.replace(".pdf", ".docx")
-    try:
-        cv = Converter(temp_pdf)
-        cv.convert(temp_docx, start=0, end=None)
-        cv.close()
-        with open(temp_docx, "rb") as f: return f.read()
-    except: return None
-    finally:
-        if os.path.exists(temp_pdf): os.remove(temp_pdf)
-        if os.path.exists(temp_docx): os.remove(temp_docx)
+@st.cache_resource
+def get_text_pdf_stats():
+    return {"docs": 0, "pages": 0, "sec": 0.0}
+
+text_pdf_stats = get_text_pdf_stats()
+
+def render_text_pdf(lines, size=12, margin=40):
+    """Qatorlar oqimini PDF ga aylantiradi: har bir sahifa to'lishi bilan vaqtinchalik faylga yoziladi.
+    (PDF baytlar, sahifalar soni) qaytaradi"""
+    t = time.perf_counter()
+    width, height = pagesizes.A4
+    leading = size * 1.2
+    per_page = int((height - 2 * margin) // leading) + 1
+    head = b"BT /F1 %d Tf %.1f TL %d %.2f Td\n" % (size, leading, margin, height - margin)
+    with tempfile.SpooledTemporaryFile(max_size=TEXT_PDF_SPOOL_MB * 1024 * 1024) as spool:
+        w = PdfStreamWriter(spool)
+        ops = []
+        for line in lines:
+            for wrapped in wrap_line(line.replace("\t", "    "), width - 2 * margin, size):
+                ops.append(pdf_string(wrapped) + b" Tj T*\n")
+                if len(ops) == per_page:
+                    w.add_page(head + b"".join(ops) + b"ET", width, height); ops = []
+        if ops or not w.kids: w.add_page(head + b"".join(ops) + b"ET", width, height)
+        w.close()
+        pages = len(w.kids)
+        spool.seek(0)
+        pdf = spool.read()
+    text_pdf_stats["docs"] += 1; text_pdf_stats["pages"] += pages; text_pdf_stats["sec"] += time.perf_counter() - t
+    tracer.record("matn_pdf", time.perf_counter() - t)
+    return pdf, pages
+
+def create_pdf_from_text(path):
+    """Matnli faylni diskdan qatorma-qator o'qib PDF qiladi"""
+    with open(path, encoding="utf-8", errors="ignore") as f: return render_text_pdf(f)
+
+def docx_to_pdf_engine(path):
+    """DOCX ni to'g'ridan-to'g'ri sessiya faylidan o'qiydi"""
+    doc = docx.Document(path)
+    return render_text_pdf(line for para in doc.paragraphs for line in para.text.split("\n"))
+
+# PDF -> Word: bir vaqtdagi jarayonlar (barcha foydalanuvchilar uchun), bitta jarayondagi sahifalar, vazifa vaqt chegarasi
+PDF_PROCS = int(st.secrets.get("PDF_PROCS", os.cpu_count() or 2))
+PDF_CHUNK_PAGES = 5
+PDF_TIMEOUT = int(st.secrets.get("PDF_TIMEOUT", 600))
+
+@st.cache_resource
+def get_pdf_slots():
+    return asyncio.Semaphore(PDF_PROCS)
+
+def page_ranges(pages):
+    """Sahifalar ro'yxatini qisqa ko'rinishga o'giradi: [1, 2, 3, 7] -> 1-3, 7"""
+    out, start = [], None
+    for i, p in enumerate(pages):
+        if start is None: start = p
+        if i + 1 == len(pages) or pages[i + 1] != p + 1:
+            out.append(f"{start}-{p}" if p != start else str(p)); start = None
+    return ", ".join(out)
+
+class PdfCache:
+    """Yuklangan PDF lar bir marta ochiladi: sessiya fayli yo'li bo'yicha PdfReader'lar LRU keshi.
+    Reader faylni mmap orqali o'qiydi (mazmun Python xotirasiga ko'chirilmaydi; fayl o'chirilsa ham xarita qoladi).
+    Sessiya fayllari o'zgarmaydi va har bir yuklash yangi nom oladi, shuning uchun yo'l kalit bo'la oladi.
+    Hajmi fayllar baytlari yig'indisi bilan cheklanadi (eng oxirgi qo'shilgani doim qoladi).
+    Bitta reader'dan bir vaqtda faqat bitta oqim o'qiydi (uning lock'i bilan)"""
+
+    def __init__(self, max_bytes):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.items = OrderedDict() # yo'l -> (PdfReader, Lock, hajm)
+
+    def get(self, path):
+        with self.lock:
+            item = self.items.get(path)
+            if item is None:
+                with open(path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                item = self.items[path] = (PyPDF2.PdfReader(mm), threading.Lock(), size)
+                self.total += size
+            self.items.move_to_end(path)
+            # Chiqarilgan reader'ni hali ishlatayotganlar o'z havolasi bilan ishni tugatadi
+            while self.total > self.max_bytes and len(self.items) > 1:
+                self.total -= self.items.popitem(last=False)[1][2]
+            return item[:2]
+
+    def stats(self):
+        with self.lock:
+            return {"fayllar": len(self.items), "mb": round(self.total / 1024 / 1024, 1)}
+
+PDF_CACHE_MB = int(st.secrets.get("PDF_CACHE_MB", 64))
+# Bitta "kesish" so'rovidagi oraliqlar chegarasi (har biri alohida fayl bo'lib yuboriladi)
+MAX_SPLIT_RANGES = 20
+SPLIT_SPEC_RE = re.compile(r"[\d,\-\s]+")
+
+@st.cache_resource
+def get_pdf_cache():
+    return PdfCache(PDF_CACHE_MB * 1024 * 1024)
+
+pdf_cache = get_pdf_cache()
+
+def parse_page_spec(spec, total):
+    """Masalan 1-3,7,10-12: har bir oraliq uchun (nomi, 0 dan boshlangan sahifa indekslari); noto'g'ri bo'lsa ValueError"""
+    ranges = []
+    for part in spec.replace(" ", "").split(","):
+        if not part: continue
+        a, _, b = part.partition("-")
+        a, b = int(a), min(int(b or a), total)
+        if not 1 <= a <= b: raise ValueError(part)
+        ranges.append((part, list(range(a - 1, b))))
+        if len(ranges) > MAX_SPLIT_RANGES: raise ValueError(f"{MAX_SPLIT_RANGES} tadan ko'p oraliq")
+    if not ranges: raise ValueError(spec)
+    return ranges
+
+def _write_pdf(pages):
+    w = PyPDF2.PdfWriter()
+    for page in pages: w.add_page(page)
+    o = io.BytesIO(); w.write(o); return o.getvalue()
+
+def pdf_extract(path, spec):
+    """Keshdagi reader'dan har bir oraliqni alohida PDF qilib yozadi: [(nom, baytlar), ...]"""
+    reader, lock = pdf_cache.get(path)
+    with lock, tracer.stage("pdf_kesish"):
+        ranges = parse_page_spec(spec, len(reader.pages))
+        return [(f"kesilgan_{name}.pdf", _write_pdf(reader.pages[i] for i in idx)) for name, idx in ranges]
+
+def pdf_merge(paths):
+    """Bir nechta PDF ni yuborilgan tartibda bitta faylga birlashtiradi"""
+    items = [pdf_cache.get(p) for p in paths]
+    with ExitStack() as stack:
+        # Lock'lar bir xil tartibda olinadi (bir vaqtdagi ikki birlashtirish bir-birini kutib qolmasligi uchun)
+        for lock in sorted({id(l): l for _, l in items}.values(), key=id): stack.enter_context(lock)
+        stack.enter_context(tracer.stage("pdf_birlashtirish"))
+        return _write_pdf(page for reader, _ in items for page in reader.pages)
 
 def images_to_docx(image_list):
-    doc = Document()
+    with tracer.stage("rasm_docx"): return _images_to_docx(image_list)
+
+def _images_to_docx(image_list):
+    doc = docx.Document()
     for img in image_list:
-        doc.add_picture(io.BytesIO(img), width=Inches(6))
+        doc.add_picture(io.BytesIO(img), width=docx.shared.Inches(6))
         doc.add_page_break()
     b = io.BytesIO(); doc.save(b); return b.getvalue()
 
@@ -160,6 +455,18 @@ def get_bot():
 bot = get_bot()
 dp = Dispatcher()
 
+@dp.update.outer_middleware()
+async def cold_start_marks(handler, event, data):
+    # Uyg'ongandan keyingi birinchi xabar va unga javob tayyor bo'lgan vaqt
+    mark("birinchi_xabar")
+    try: return await handler(event, data)
+    finally: mark("birinchi_javob")
+
+@dp.callback_query.outer_middleware()
+async def trace_buttons(handler, event, data):
+    # Har bir tugma (OCR, HD, PDF...) ishining boshidan oxirigacha vaqti
+    with tracer.stage(f"tugma:{event.data}"): return await handler(event, data)
+
 def main_kb(uid):
     kb = [[KeyboardButton(text="ℹ️ Info"), KeyboardButton(text="👨‍💻 Adminga murojaat")]]
     if str(uid) == ADMIN_ID:
@@ -172,24 +479,26 @@ INFO_TEXT = """
 📸 <b>Rasm funksiyalari:</b>
 • <b>🔍 Google OCR:</b> Rasmdagi matnni o'qish (Eng aniq)
 • <b>📄 PDF Skaner:</b> Rasmlarni PDF qilish (HD sifat)
-• <b>✨ Tiniqlash:</b> Sifatni oshirish
+• <b>🔎 Qidiriladigan PDF:</b> Skaner + ko'rinmas OCR matn qatlami
+• <b>✨ Tiniqlash:</b> Sifatni oshirish (⚡ Tez HD - bir necha barobar tezroq)
 
 📂 <b>Fayl funksiyalari:</b>
 • <b>PDF ➡️ Word</b> (Konvertatsiya)
 • <b>Word ➡️ PDF</b>
-• <b>Split PDF</b> (Kesish)
+• <b>Split PDF</b> (Kesish, bir nechta oraliq: 1-3,7,10-12)
+• <b>PDF birlashtirish</b> (bir nechta PDF yuboring)
 """
 
 # --- 6. HANDLERS ---
 @dp.message(Command("start"))
 async def start(m: types.Message):
-    G_DATA[m.from_user.id] = {'files': [], 'state': None}
+    sessions.reset(m.from_user.id)
     await m.answer(f"👋 Salom {m.from_user.first_name}!\nGoogle Vision AI ishlamoqda.", reply_markup=main_kb(m.from_user.id))
 
 @dp.message(F.text)
 async def text_handler(m: types.Message):
     uid, txt = m.from_user.id, m.text
-    state = G_DATA.get(uid, {}).get('state')
+    state = sessions.state(uid).get('state')
 
     if str(uid) == ADMIN_ID and m.reply_to_message:
         replied_text = m.reply_to_message.text or m.reply_to_message.caption or ""
@@ -201,56 +510,130 @@ async def text_handler(m: types.Message):
             except: await m.answer("❌ Xatolik.")
         return
 
-    if state == "split":
+    # Kesish rejimida faqat sahifa raqamlariga o'xshagan matn olinadi; menyu tugmalari odatdagidek ishlaydi
+    if state == "split" and SPLIT_SPEC_RE.fullmatch(txt):
         try:
-            s, e = map(int, txt.split("-"))
             loop = asyncio.get_event_loop()
-            def do_split():
-                r = PdfReader(io.BytesIO(G_DATA[uid]['doc']))
-                w = PdfWriter()
-                for i in range(s-1, min(e, len(r.pages))): w.add_page(r.pages[i])
-                o = io.BytesIO(); w.write(o); return o.getvalue()
-            pdf = await loop.run_in_executor(None, do_split)
-            await m.answer_document(BufferedInputFile(pdf, filename="kesilgan.pdf"))
-        except: await m.answer("❌ Xato! Masalan: 1-5")
-        G_DATA[uid]['state'] = None
+            path = sessions.blob_path(uid, 'pdfs')
+            if path is None: raise RuntimeError("sessiya muddati tugagan, PDF ni qaytadan yuboring")
+            outputs = await loop.run_in_executor(None, pdf_extract, path, txt)
+        except ValueError:
+            await m.answer(f"❌ Xato! Masalan: 1-3,7,10-12 (ko'pi bilan {MAX_SPLIT_RANGES} ta oraliq)")
+        except Exception as e:
+            await m.answer(f"❌ Xatolik: {html.escape(str(e))}")
+        else:
+            try:
+                # Bir nechta oraliq - albom qilib (10 tadan) yuboriladi; albomda kamida 2 ta fayl bo'lishi kerak,
+                # shuning uchun yolg'iz qolgan fayl oddiy hujjat bo'lib ketadi
+                for i in range(0, len(outputs), 10):
+                    chunk = outputs[i:i + 10]
+                    if len(chunk) == 1: await m.answer_document(BufferedInputFile(chunk[0][1], filename=chunk[0][0]))
+                    else: await m.answer_media_group([InputMediaDocument(media=BufferedInputFile(pdf, filename=name)) for name, pdf in chunk])
+            except Exception as e: await m.answer(f"❌ Yuborishda xatolik: {html.escape(str(e))}")
+        sessions.update(uid, state=None)
         return
 
     if txt == "ℹ️ Info": await m.answer(INFO_TEXT)
     elif txt == "👨‍💻 Adminga murojaat":
-        G_DATA[uid]['state'] = "contact"
+        sessions.update(uid, state="contact")
         await m.answer("Xabarni yozing:", reply_markup=types.ReplyKeyboardRemove())
     elif state == "contact":
         await bot.send_message(ADMIN_ID, f"📩 #ID{uid} Userdan:\n{html.escape(txt)}")
         await m.answer("✅ Yuborildi.", reply_markup=main_kb(uid))
-        G_DATA[uid]['state'] = None
+        sessions.update(uid, state=None)
 
-@dp.message(F.photo)
-async def photo_h(m: types.Message):
-    uid = m.from_user.id
-    if uid not in G_DATA: G_DATA[uid] = {'files': []}
-    f = await bot.get_file(m.photo[-1].file_id)
-    c = await bot.download_file(f.file_path)
-    G_DATA[uid]['files'].append(c.read())
+# Albom (media group) rasmlari shu vaqt ichida yig'iladi va bitta javob bilan qabul qilinadi
+MEDIA_GROUP_WAIT = 1.0
+DOWNLOAD_WORKERS = int(st.secrets.get("DOWNLOAD_WORKERS", 4))
+# Yuklanadigan fayl hajmi chegarasi (Bot API 20 MB dan kattasini bermaydi); shundan kichigi xotirada, kattasi diskda
+MAX_FILE_MB = int(st.secrets.get("MAX_FILE_MB", 20))
+DOWNLOAD_SPOOL_MB = 4
+albums = {} # media_group_id -> {"msgs": [...], "task": kutish vazifasi}
+
+@st.cache_resource
+def get_download_limiter():
+    # Telegramdan bir vaqtda yuklanadigan fayllar chegarasi (barcha foydalanuvchilar uchun umumiy)
+    return asyncio.Semaphore(DOWNLOAD_WORKERS)
+
+async def download(file_id, file_size=None):
+    """Fayl bo'laklab vaqtinchalik faylga (spool) yuklanadi; katta fayl yuklashdan oldin rad etiladi (FileTooLarge)"""
+    async with get_download_limiter():
+        with tracer.stage("yuklash"):
+            return await fetch_file(bot, file_id, MAX_FILE_MB * 1024 * 1024, DOWNLOAD_SPOOL_MB * 1024 * 1024, file_size)
+
+def store_blob(add, uid, name, spool):
+    """Spool sessiya papkasiga bo'laklab ko'chiriladi va yopiladi"""
+    with spool: return add(uid, name, spool)
+
+async def save_photos(msgs):
+    """Rasmlarni parallel yuklab, sessiyaga yuborilgan tartibda qo'shadi va bitta tugmalar to'plami bilan javob beradi"""
+    msgs = sorted(msgs, key=lambda x: x.message_id)
+    m, uid = msgs[-1], msgs[-1].from_user.id
+    images = await asyncio.gather(*[download(x.photo[-1].file_id, x.photo[-1].file_size) for x in msgs], return_exceptions=True)
+    loop = asyncio.get_event_loop()
+    added, count = 0, 0
+    try:
+        for i, img in enumerate(images):
+            if isinstance(img, BaseException): raise img
+            count = await loop.run_in_executor(None, store_blob, sessions.add_blob, uid, 'files', img)
+            added += 1
+    except (SessionQuotaError, FileTooLarge) as e:
+        for img in images[i + 1:]:
+            if not isinstance(img, BaseException): img.close()
+        await m.reply(f"❌ Rasm juda katta (limit: {MAX_FILE_MB} MB)." if isinstance(e, FileTooLarge) else
+                      f"❌ Limit: {USER_QUOTA_MB} MB. Avval yuborilgan rasmlarni ishlating yoki tozalang.")
+        if not added: return
     
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔍 Google OCR", callback_data="to_ocr")],
-        [InlineKeyboardButton(text="✨ HD Sifat", callback_data="to_enhance"), InlineKeyboardButton(text="📝 Wordga", callback_data="to_word")],
+        [InlineKeyboardButton(text="✨ HD Sifat", callback_data="to_enhance"), InlineKeyboardButton(text="⚡ Tez HD", callback_data="to_enhance_fast"),
+         InlineKeyboardButton(text="📝 Wordga", callback_data="to_word")],
         [InlineKeyboardButton(text="📄 PDF (Orig)", callback_data="pdf_orig"), InlineKeyboardButton(text="📄 PDF (BW)", callback_data="pdf_bw")],
+        [InlineKeyboardButton(text="🔎 Qidiriladigan PDF (OCR)", callback_data="to_searchable")],
         [InlineKeyboardButton(text="🗑 Tozalash", callback_data="clear")]
     ])
-    await m.reply(f"✅ Rasm #{len(G_DATA[uid]['files'])}.\nTanlang:", reply_markup=kb)
+    head = f"✅ Rasm #{count}." if added == 1 else f"✅ {added} ta rasm qabul qilindi (jami {count})."
+    await m.reply(f"{head}\nTanlang:", reply_markup=kb)
+
+async def flush_album(group_id):
+    await asyncio.sleep(MEDIA_GROUP_WAIT)
+    msgs = albums.pop(group_id)["msgs"]
+    try: await save_photos(msgs)
+    except Exception as e: print(f"Album Error: {e}")
+
+@dp.message(F.photo)
+async def photo_h(m: types.Message):
+    if not m.media_group_id:
+        await save_photos([m]); return
+    # Albomning har bir rasmi kutish vaqtini yangilaydi; oxirgisidan keyin hammasi birga ishlanadi
+    g = albums.setdefault(m.media_group_id, {"msgs": [], "task": None})
+    g["msgs"].append(m)
+    if g["task"]: g["task"].cancel()
+    g["task"] = asyncio.create_task(flush_album(m.media_group_id))
 
 @dp.message(F.document)
 async def doc_h(m: types.Message):
     uid = m.from_user.id
-    f = await bot.get_file(m.document.file_id)
-    c = await bot.download_file(f.file_path)
-    G_DATA[uid] = {'doc': c.read(), 'state': None}
+    is_pdf = "pdf" in (m.document.mime_type or "")
+    sessions.update(uid, state=None)
+    loop = asyncio.get_event_loop()
+    # PDF lar ro'yxatga yig'iladi (birlashtirish uchun), boshqa hujjatlardan faqat oxirgisi saqlanadi
+    try:
+        spool = await download(m.document.file_id, m.document.file_size)
+        count = await loop.run_in_executor(None, store_blob, sessions.add_blob if is_pdf else sessions.set_blob, uid, 'pdfs' if is_pdf else 'doc', spool)
+    except FileTooLarge:
+        await m.reply(f"❌ Fayl juda katta (limit: {MAX_FILE_MB} MB).")
+        return
+    except SessionQuotaError:
+        await m.reply(f"❌ Fayl juda katta (limit: {USER_QUOTA_MB} MB).")
+        return
     
     kb = []
-    if "pdf" in m.document.mime_type:
+    if is_pdf:
         kb = [[InlineKeyboardButton(text="✂️ Kesish", callback_data="split"), InlineKeyboardButton(text="📝 Wordga", callback_data="pdf2word")]]
+        if count > 1:
+            kb.append([InlineKeyboardButton(text=f"🔗 Birlashtirish ({count} ta PDF)", callback_data="merge"),
+                       InlineKeyboardButton(text="🗑 Tozalash", callback_data="clear_pdfs")])
     else:
         kb = [[InlineKeyboardButton(text="📄 PDFga", callback_data="any2pdf")]]
     await m.reply(f"📂 {m.document.file_name}", reply_markup=InlineKeyboardMarkup(inline_keyboard=kb))
@@ -258,76 +641,115 @@ async def doc_h(m: types.Message):
 @dp.callback_query(F.data)
 async def call_worker(call: types.CallbackQuery):
     uid, d = call.from_user.id, call.data
-    files = G_DATA.get(uid, {}).get('files', [])
+    loop = asyncio.get_event_loop()
+    # Rasmlar diskdan faqat ularga ishlov beradigan tugmalar uchun o'qiladi
+    files = await loop.run_in_executor(None, sessions.blobs, uid, 'files') if d in ("to_ocr", "to_searchable", "to_enhance", "to_enhance_fast", "to_word") or d.startswith("pdf_") else []
+    # Hujjatlar xotiraga o'qilmaydi: konvertorlarga sessiya faylining yo'li beriladi
+    doc = sessions.blob_path(uid, 'doc' if d == "any2pdf" else 'pdfs') if d in ("any2pdf", "pdf2word", "split", "merge") else None
+    if d in ("any2pdf", "pdf2word", "split", "merge") and doc is None:
+        await call.message.answer("⌛️ Sessiya muddati tugagan. Faylni qaytadan yuboring."); return
 
     if d == "clear": 
-        G_DATA[uid]['files'] = []
+        sessions.clear_blobs(uid, 'files')
         await call.message.delete(); await call.message.answer("🗑 Tozalandi."); return
 
     if d == "to_ocr":
         if not files: return
         msg = await call.message.edit_text("⏳ <b>Google Vision...</b>")
-        loop = asyncio.get_event_loop()
+        texts = await loop.run_in_executor(None, ocr_pages, files)
         res = ""
-        for i, img in enumerate(files):
-            txt = await loop.run_in_executor(None, google_vision_scan, img)
+        for i, txt in enumerate(texts):
             res += f"📄 Sahifa {i+1}:\n{html.escape(txt)}\n{'='*20}\n"
         
         if len(res) > 3000:
             await call.message.answer_document(BufferedInputFile(res.encode(), filename="ocr.txt"))
         else:
             await call.message.answer(f"📝 <b>Natija:</b>\n<pre>{res}</pre>")
-        await msg.delete(); G_DATA[uid]['files'] = []
+        await msg.delete(); sessions.clear_blobs(uid, 'files')
 
-    elif d == "to_enhance":
+    elif d == "to_searchable":
+        if not files: return
+        msg = await call.message.edit_text("⏳ <b>Google Vision + PDF...</b>")
+        # Har bir sahifa bir marta o'qiladi: bir xil baytlar Vision'ga ham, PDF ga ham beriladi
+        words = await loop.run_in_executor(None, ocr_pages, files, "words")
+        pdf = await loop.run_in_executor(None, searchable_pdf, files, words)
+        failed = sum(w.startswith("❌") for w in words)
+        note = f"⚠️ {failed} ta sahifada matn qatlami yo'q" if failed else None
+        await call.message.answer_document(BufferedInputFile(pdf, filename="scan_ocr.pdf"), caption=note)
+        await msg.delete(); sessions.clear_blobs(uid, 'files')
+
+    elif d in ("to_enhance", "to_enhance_fast"):
+        preset = "fast" if d == "to_enhance_fast" else "quality"
         msg = await call.message.edit_text("✨ <b>Tiniqlashtirilmoqda...</b>")
-        loop = asyncio.get_event_loop()
-        for i, img in enumerate(files):
-            res = await loop.run_in_executor(None, process_image_effect, img, "enhance")
-            await call.message.answer_photo(BufferedInputFile(res, filename=f"hd_{i+1}.jpg"))
+        # Barcha rasmlar birdaniga hovuzga beriladi, natijalar tartib bilan yuboriladi
+        tasks = [asyncio.ensure_future(enhance_photo(img, preset)) for img in files]
+        try:
+            for i, task in enumerate(tasks):
+                res, sec = await task
+                await call.message.answer_photo(BufferedInputFile(res, filename=f"hd_{i+1}.jpg"), caption=f"✨ {i+1}/{len(files)} · ⏱ {sec:.1f} s")
+        finally:
+            for task in tasks: task.cancel() # Xato bo'lsa, qolgan rasmlar hovuzni band qilmasin
         await msg.delete()
 
     elif d.startswith("pdf_"):
         mode = d.split("_")[1]
         msg = await call.message.edit_text("⏳ <b>PDF yasalmoqda...</b>")
-        loop = asyncio.get_event_loop()
         processed = []
         for img in files:
             p = await loop.run_in_executor(None, process_image_effect, img, mode)
             processed.append(p)
-        pdf = await loop.run_in_executor(None, img2pdf.convert, processed)
+        pdf = await loop.run_in_executor(None, scans_to_pdf, processed)
         await call.message.answer_document(BufferedInputFile(pdf, filename=f"scan_{mode}.pdf"))
-        await msg.delete(); G_DATA[uid]['files'] = []
+        await msg.delete(); sessions.clear_blobs(uid, 'files')
 
     elif d == "to_word":
         msg = await call.message.edit_text("⏳ <b>Wordga...</b>")
-        loop = asyncio.get_event_loop()
         docx = await loop.run_in_executor(None, images_to_docx, files)
         await call.message.answer_document(BufferedInputFile(docx, filename="images.docx"))
-        await msg.delete(); G_DATA[uid]['files'] = []
+        await msg.delete(); sessions.clear_blobs(uid, 'files')
     
     elif d == "any2pdf":
         msg = await call.message.edit_text("⏳ <b>PDFga...</b>")
-        loop = asyncio.get_event_loop()
-        doc_c = G_DATA[uid]['doc']
         try:
-            if b"PK\x03\x04" in doc_c[:4]: pdf = await loop.run_in_executor(None, docx_to_pdf_engine, doc_c)
-            else: pdf = await loop.run_in_executor(None, create_pdf_from_text, doc_c.decode(errors='ignore'))
-            await call.message.answer_document(BufferedInputFile(pdf, filename="hujjat.pdf"))
+            with open(doc, "rb") as f: is_docx = f.read(4) == b"PK\x03\x04"
+            pdf, pages = await loop.run_in_executor(None, docx_to_pdf_engine if is_docx else create_pdf_from_text, doc)
+            await call.message.answer_document(BufferedInputFile(pdf, filename="hujjat.pdf"), caption=f"📄 {pages} sahifa")
         except: await call.message.answer("❌ Xatolik.")
         await msg.delete()
 
     elif d == "pdf2word":
         msg = await call.message.edit_text("⏳ <b>Wordga...</b>")
-        loop = asyncio.get_event_loop()
-        docx = await loop.run_in_executor(None, convert_pdf_to_docx_safe, G_DATA[uid]['doc'])
-        if docx: await call.message.answer_document(BufferedInputFile(docx, filename="converted.docx"))
-        else: await call.message.answer("❌ Xatolik.")
+        last = [time.monotonic()]
+        async def progress(done, total):
+            if done < total and time.monotonic() - last[0] < 3: return
+            last[0] = time.monotonic()
+            try: await msg.edit_text(f"⏳ <b>Wordga...</b> {done}/{total} sahifa")
+            except Exception: pass
+        try:
+            with tracer.stage("pdf2docx"): docx, failed, err = await pdf_engine.convert(doc, get_pdf_slots(), PDF_PROCS, PDF_CHUNK_PAGES, PDF_TIMEOUT, progress)
+        except Exception as e: docx, failed, err = None, [], str(e)
+        if docx:
+            note = f"⚠️ O'tkazilmagan sahifalar: {page_ranges(failed)}" if failed else None
+            await call.message.answer_document(BufferedInputFile(docx, filename="converted.docx"), caption=note)
+        else: await call.message.answer(f"❌ Xatolik: {html.escape(err or 'sahifalar topilmadi')}")
         await msg.delete()
         
     elif d == "split":
-        G_DATA[uid]['state'] = "split"
-        await call.message.answer("✂️ Oraliqni yozing (1-3):")
+        sessions.update(uid, state="split")
+        await call.message.answer("✂️ Sahifalarni yozing (masalan: 1-3,7,10-12).\nHar bir oraliq alohida fayl bo'ladi.")
+
+    elif d == "merge":
+        msg = await call.message.edit_text("⏳ <b>Birlashtirilmoqda...</b>")
+        try:
+            pdf = await loop.run_in_executor(None, lambda: pdf_merge(sessions.blob_paths(uid, 'pdfs')))
+            await call.message.answer_document(BufferedInputFile(pdf, filename="birlashtirilgan.pdf"))
+            sessions.clear_blobs(uid, 'pdfs')
+        except Exception as e: await call.message.answer(f"❌ Xatolik: {html.escape(str(e))}")
+        await msg.delete()
+
+    elif d == "clear_pdfs":
+        sessions.clear_blobs(uid, 'pdfs')
+        await call.message.delete(); await call.message.answer("🗑 Tozalandi.")
 
 # --- 7. RUNNER (MUHIM: THREADING FIX) ---
 def run_bot():
@@ -339,19 +761,48 @@ def run_bot():
         async def runner():
             # Webhookni tozalash va Pollingni boshlash
             await bot.delete_webhook(drop_pending_updates=True)
+            mark("bot_tayyor")
             await dp.start_polling(bot, handle_signals=False)
             
         new_loop.run_until_complete(runner())
     except Exception as e:
         print(f"Bot Error: {e}")
 
-# Streamlit har safar yangilanganda thread qayta ochilmasligi uchun tekshiruv
-if not any(t.name == "AiogramThread" for t in threading.enumerate()):
-    t = threading.Thread(target=run_bot, name="AiogramThread", daemon=True)
-    t.start()
+BOT_THREAD = "AiogramThread-vision"
+
+@st.cache_resource
+def start_bot():
+    """Bot jarayonda bir marta ishga tushadi: Streamlit rerun'lari (sahifa ochilishi, keep-alive) unga tegmaydi.
+    Kesh tozalansa ham ikkinchi polling ochilmasligi uchun ishlab turgan thread tekshiriladi"""
+    t = next((t for t in threading.enumerate() if t.name == BOT_THREAD), None)
+    if t is None:
+        t = threading.Thread(target=run_bot, name=BOT_THREAD, daemon=True)
+        t.start()
+    return t
+
+start_bot()
 
 # --- 8. DASHBOARD ---
 st.title("🛡️ AI Studio Pro - Vision Edition")
 st.success("Bot muvaffaqiyatli ishga tushdi! 🟢")
 st.write(f"Joriy Project ID: `{st.secrets['gcp_service_account']['project_id']}`")
     
+st.write(f"**Sessiyalar:** {sessions.stats()}")
+st.write(f"**OCR keshi:** {ocr_cache.stats()}")
+st.write(f"**PDF keshi:** {pdf_cache.stats()}")
+if enhance_stats["images"]:
+    st.write(f"**HD effekt:** {enhance_stats['images']} ta rasm | o'rtacha {enhance_stats['sec'] / enhance_stats['images']:.2f} s | "
+             f"{enhance_stats['mpix'] / enhance_stats['sec']:.1f} MP/s | {IMAGE_PROCS} jarayon")
+if text_pdf_stats["docs"]:
+    st.write(f"**Matn → PDF:** {text_pdf_stats['docs']} ta hujjat | {text_pdf_stats['pages']} sahifa | "
+             f"{text_pdf_stats['pages'] / max(text_pdf_stats['sec'], 1e-6):.0f} sahifa/s")
+_cold = cold_start_report()
+st.write(f"**Sovuq start (jarayon boshidan, s):** {_cold['bosqichlar']}")
+st.caption(f"Kechiktirilgan importlar (s): {_cold['importlar']}")
+tracer.gauge("albomlar", lambda: len(albums))
+tracer.gauge("sessiyalar", lambda: sessions.stats()["xotirada"])
+if TRACING:
+    _trace = tracer.snapshot()
+    st.write(f"**Hovuzlar:** {_trace['hovuzlar']} | **Navbatlar:** {_trace['navbatlar']}")
+    if _trace["bosqichlar"]: st.table(_trace["bosqichlar"])
+    st.download_button("⬇️ Kuzatuv (JSON)", tracer.to_json(), file_name="vision_trace.json", mime="application/json")
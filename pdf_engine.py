@@ -0,0 +1,103 @@
+"""PDF -> Word: sahifa oraliqlari alohida jarayonlarda tahlil qilinadi, natijalar bitta docx ga yig'iladi.
+
+Har bir oraliq o'z jarayonida ishlaydi (fork), shuning uchun vaqt chegarasidan oshsa, uni o'ldirish mumkin.
+Bir vaqtdagi jarayonlar soni umumiy semafor bilan cheklanadi; har bir vazifa navbatga bittadan
+oraliq qo'yadi, shuning uchun bir nechta konvertatsiya navbatni adolatli bo'lishadi.
+"""
+import asyncio
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import time
+import traceback
+
+from pdf2docx import Converter
+
+def _parse_range(pdf_path, indexes, out_path):
+    """Bola jarayon: berilgan sahifalarni tahlil qilib, natijani JSON ga yozadi"""
+    try:
+        cv = Converter(pdf_path)
+        settings = cv.default_settings
+        cv.load_pages(pages=indexes)
+        cv.parse_document(**settings).parse_pages(**settings).serialize(out_path)
+        cv.close()
+    except Exception:
+        with open(out_path + ".err", "w", encoding="utf-8") as f: f.write(traceback.format_exc(limit=2))
+        os._exit(1)
+
+def _merge(pdf_path, parts, docx_path):
+    """Tahlil qilingan qismlardan bitta docx yasaydi (rasmlar va havolalar bitta hujjatga yoziladi).
+    Yasalgan sahifalar raqamlarini qaytaradi"""
+    cv = Converter(pdf_path)
+    settings = cv.default_settings
+    cv.load_pages()
+    for part in parts: cv.deserialize(part)
+    done = [p.id for p in cv.pages if p.finalized]
+    if done: cv.make_docx(docx_path, **settings)
+    cv.close()
+    return done
+
+def page_count(pdf_path):
+    cv = Converter(pdf_path)
+    try: return len(cv.fitz_doc)
+    finally: cv.close()
+
+def _link(src, dst):
+    """Faylni nusxalamasdan ish papkasiga ulaydi (hard link); boshqa fayl tizimida bo'lsa - nusxalaydi.
+    Shunda sessiya fayli konvertatsiya davomida o'chirilsa ham jarayonlar uni o'qiy oladi"""
+    try: os.link(src, dst)
+    except OSError: shutil.copyfile(src, dst)
+
+async def convert(src_path, slots, workers=2, chunk_pages=5, timeout=600, progress=None):
+    """src_path dagi PDF ni docx ga o'giradi. slots - barcha vazifalar uchun umumiy asyncio.Semaphore,
+    workers - shu vazifaning bir vaqtdagi jarayonlari, progress(tayyor, jami) - har bir oraliqdan keyin chaqiriladi.
+    (docx baytlar yoki None, o'tkazilmagan sahifalar (1 dan), xato matni) qaytaradi"""
+    loop = asyncio.get_running_loop()
+    tmp = tempfile.mkdtemp(prefix="pdf2docx_")
+    try:
+        pdf_path = os.path.join(tmp, "in.pdf")
+        await loop.run_in_executor(None, _link, src_path, pdf_path)
+        total = await loop.run_in_executor(None, page_count, pdf_path)
+        queue = [list(range(i, min(i + chunk_pages, total))) for i in range(0, total, chunk_pages)]
+        # Vaqt chegarasi vazifa birinchi slotni olganda boshlanadi: boshqa konvertatsiyalar ortida navbatda kutish hisobga kirmaydi
+        parts, errors, state = [], [], {"done": 0, "deadline": None}
+        ctx = mp.get_context("fork")
+
+        async def worker():
+            while queue:
+                indexes = queue.pop(0)
+                span = f"{indexes[0] + 1}-{indexes[-1] + 1}"
+                out = os.path.join(tmp, f"part_{indexes[0]}.json")
+                # Semafor navbati FIFO: oraliq tugagach vazifa navbat oxiriga qaytadi
+                async with slots:
+                    if state["deadline"] is None: state["deadline"] = time.monotonic() + timeout
+                    deadline = state["deadline"]
+                    if time.monotonic() > deadline:
+                        errors.append(f"{span}: vaqt tugadi"); continue
+                    p = ctx.Process(target=_parse_range, args=(pdf_path, indexes, out), daemon=True)
+                    p.start()
+                    while p.is_alive() and time.monotonic() < deadline:
+                        await asyncio.sleep(0.2)
+                    if p.is_alive():
+                        p.kill()
+                    p.join()
+                if p.exitcode == 0 and os.path.exists(out):
+                    parts.append(out)
+                elif os.path.exists(out + ".err"):
+                    with open(out + ".err", encoding="utf-8") as f: errors.append(f"{span}: {f.read().strip().splitlines()[-1]}")
+                else: # Vaqt chegarasida o'ldirilgan yoki xotira yetmay yiqilgan jarayon
+                    errors.append(f"{span}: vaqt tugadi" if p.exitcode < 0 else f"{span}: jarayon xatosi ({p.exitcode})")
+                state["done"] += len(indexes)
+                if progress: await progress(state["done"], total)
+
+        await asyncio.gather(*[worker() for _ in range(max(1, workers))])
+        docx_path = os.path.join(tmp, "out.docx")
+        done = await loop.run_in_executor(None, _merge, pdf_path, parts, docx_path) if parts else []
+        failed = sorted(set(range(1, total + 1)) - {i + 1 for i in done})
+        data = None
+        if done:
+            with open(docx_path, "rb") as f: data = f.read()
+        return data, failed, "; ".join(errors)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,114 @@
+"""Oddiy PDF yozuvchi: har bir sahifa tayyor bo'lishi bilan faylga yoziladi, xotirada butun hujjat turmaydi.
+
+Faqat standart Helvetica (WinAnsi) shrifti ishlatiladi, shuning uchun shrift faylga joylanmaydi.
+Ko'rinmas OCR qatlami uchun F2 - Identity-H shrift: belgi kodi = Unicode, ToUnicode orqali qidiriladi va nusxalanadi
+(glif chizilmaydi, shuning uchun shrift fayli kerak emas).
+Obyektlar: 1 - katalog, 2 - sahifalar daraxti, 3 - F1, 4 - F2; qolganlari sahifalar bilan birga yoziladi.
+"""
+import zlib
+from functools import lru_cache
+
+from lazy_import import lazy
+
+pdfmetrics = lazy("reportlab.pdfbase.pdfmetrics")
+
+FONT = "Helvetica"
+
+@lru_cache(maxsize=65536)
+def word_width(word, size):
+    """So'z kengligi (pt): belgilar kengliklari reportlab metrikasidan, so'zlar keshlanadi"""
+    return pdfmetrics.stringWidth(word, FONT, size)
+
+def wrap_line(line, max_width, size):
+    """Qatorni so'zlar bo'yicha max_width ga sig'adigan qatorlarga bo'ladi; juda uzun so'z belgilar bo'yicha bo'linadi"""
+    space = word_width(" ", size)
+    cur, cur_w = [], 0.0
+    for word in line.split():
+        w = word_width(word, size)
+        if cur and cur_w + space + w > max_width:
+            yield " ".join(cur); cur, cur_w = [], 0.0
+        while w > max_width:
+            cut = 1
+            while cut < len(word) and word_width(word[:cut + 1], size) <= max_width: cut += 1
+            yield word[:cut]
+            word = word[cut:]; w = word_width(word, size)
+        cur.append(word); cur_w += (space if len(cur) > 1 else 0) + w
+    if cur or not line.strip(): yield " ".join(cur)
+
+def pdf_string(text):
+    """PDF matn satri: WinAnsi kodlash, qavslar va teskari chiziq ekranlanadi"""
+    raw = text.encode("cp1252", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def invisible_text(words, scale, ox, oy, img_h):
+    """OCR so'zlari uchun ko'rinmas (3 Tr) matn buyruqlari. words - [(matn, x0, y0, x1, y1)] rasm piksellarida;
+    so'z o'z qutisiga joylanadi: shrift o'lchami quti balandligidan, kengligi Tz (gorizontal masshtab) bilan"""
+    ops = [b"BT 3 Tr\n"]
+    for text, x0, y0, x1, y1 in words:
+        if not text or x1 <= x0: continue
+        # So'zdan keyingi bo'sh joy: nusxalanganda so'zlar qo'shilib ketmasligi uchun
+        code = (text + " ").encode("utf-16-be", "replace")
+        size = max(1.0, (y1 - y0) * scale)
+        width = len(code) // 2 * size * 0.5 # F2 belgilarining kengligi: /DW 500
+        ops.append(b"/F2 %.2f Tf %.1f Tz 1 0 0 1 %.2f %.2f Tm <%s> Tj\n" % (
+            size, 100 * (x1 - x0) * scale / width, ox + x0 * scale, oy + (img_h - y1) * scale + size * 0.2, code.hex().encode()))
+    ops.append(b"ET\n")
+    return b"".join(ops)
+
+class PdfStreamWriter:
+    def __init__(self, out):
+        self.out = out
+        self.offsets = {}
+        self.kids = []
+        self.next_id = 5
+        self.out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _alloc(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _obj(self, num, body):
+        self.offsets[num] = self.out.tell()
+        self.out.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+
+    def _stream(self, data):
+        num = self._alloc()
+        data = zlib.compress(data, 6)
+        self._obj(num, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data) + data + b"\nendstream")
+        return num
+
+    def add_image(self, data, width, height, color=b"/DeviceRGB"):
+        """JPEG rasmni qayta kodlamasdan (DCTDecode) joylaydi va obyekt raqamini qaytaradi"""
+        num = self._alloc()
+        self._obj(num, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s /BitsPerComponent 8 /Filter /DCTDecode /Length %d >>\nstream\n"
+                  % (width, height, color, len(data)) + data + b"\nendstream")
+        return num
+
+    def add_page(self, content, width, height, images=None):
+        """content - sahifa chizish buyruqlari (F1 - Helvetica, F2 - OCR qatlami); images - {nom: rasm obyekti}"""
+        content_id = self._stream(content)
+        xobj = b" /XObject << %s >>" % b" ".join(b"/%s %d 0 R" % (n.encode(), i) for n, i in images.items()) if images else b""
+        page_id = self._alloc()
+        self._obj(page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Resources << /Font << /F1 3 0 R /F2 4 0 R >>%s >> /Contents %d 0 R >>"
+                  % (width, height, xobj, content_id))
+        self.kids.append(page_id)
+        return page_id
+
+    def close(self):
+        self._obj(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % FONT.encode())
+        cmap = self._stream(b"/CIDInit /ProcSet findresource begin 12 dict begin begincmap /CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def "
+                            b"/CMapName /Adobe-Identity-UCS def /CMapType 2 def 1 begincodespacerange <0000> <FFFF> endcodespacerange "
+                            b"1 beginbfrange <0000> <FFFF> <0000> endbfrange endcmap CMapName currentdict /CMap defineresource pop end end")
+        desc, cid = self._alloc(), self._alloc()
+        self._obj(desc, b"<< /Type /FontDescriptor /FontName /GlyphLessFont /Flags 5 /FontBBox [0 -200 500 800] /ItalicAngle 0 "
+                        b"/Ascent 800 /Descent -200 /CapHeight 800 /StemV 80 >>")
+        self._obj(cid, b"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /GlyphLessFont /CIDToGIDMap /Identity /DW 500 "
+                       b"/FontDescriptor %d 0 R /CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> >>" % desc)
+        self._obj(4, b"<< /Type /Font /Subtype /Type0 /BaseFont /GlyphLessFont /Encoding /Identity-H /DescendantFonts [%d 0 R] /ToUnicode %d 0 R >>" % (cid, cmap))
+        self._obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in self.kids), len(self.kids)))
+        self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self.out.tell()
+        self.out.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id)
+        for num in range(1, self.next_id):
+            self.out.write(b"%010d 00000 n \n" % self.offsets[num])
+        self.out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, xref))
@@ -0,0 +1,180 @@
+"""Foydalanuvchi sessiyalari: xotirada cheklangan LRU, TTL, foydalanuvchi boshiga bayt kvotasi.
+
+Kichik holat (rejim, tanlovlar) SQLite'ga yoziladi va qayta ishga tushirishdan keyin ham saqlanadi.
+Katta ma'lumotlar (rasmlar, hujjatlar) xotirada emas, diskdagi fayllarda turadi - xotiraga faqat
+ishlov berish paytida o'qiladi. Shuning uchun tashlab ketilgan sessiyalar xotirani to'ldirmaydi.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class SessionQuotaError(Exception):
+    """Foydalanuvchining fayllar uchun ajratilgan hajmi tugadi"""
+
+
+class SessionStore:
+    BLOBS = "_blobs" # holat ichidagi kalit: {nom: [[fayl, hajm], ...]}
+
+    def __init__(self, path, blob_dir, ttl=24 * 3600, max_live=1000, user_quota=50 * 1024 * 1024, flush_sec=5):
+        self.ttl, self.max_live, self.user_quota, self.flush_sec = ttl, max_live, user_quota, flush_sec
+        self.blob_dir = blob_dir
+        os.makedirs(blob_dir, exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS sessions (uid TEXT PRIMARY KEY, data TEXT, updated REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        self.db.commit()
+        self.live = OrderedDict() # uid -> holat; tartib - oxirgi foydalanish tartibi
+        self.touched = {}         # uid -> oxirgi foydalanish vaqti
+        self.dirty = set()
+        self.last_flush = self.last_sweep = 0.0
+
+    # --- Kichik holat ---
+    def state(self, uid):
+        """Sessiya holatini (dict) qaytaradi; o'zgartirilgandan keyin update() chaqirilishi kerak"""
+        uid = str(uid)
+        with self.lock:
+            s = self.live.get(uid)
+            if s is None:
+                row = self.db.execute("SELECT data, updated FROM sessions WHERE uid=?", (uid,)).fetchone()
+                s = json.loads(row[0]) if row and row[1] > time.time() - self.ttl else {}
+                self.live[uid] = s
+            self.live.move_to_end(uid)
+            self.touched[uid] = time.time()
+            self._maintain()
+            return s
+
+    def update(self, uid, **values):
+        with self.lock:
+            self.state(uid).update(values)
+            self.dirty.add(str(uid))
+
+    def reset(self, uid, **values):
+        """Sessiyani (fayllari bilan birga) tozalab, yangi qiymatlar bilan boshlaydi"""
+        uid = str(uid)
+        with self.lock:
+            s = self.state(uid)
+            self._drop_blobs(uid, s)
+            s.clear(); s.update(values)
+            self.dirty.add(uid)
+
+    # --- Katta ma'lumotlar (diskda) ---
+    def add_blob(self, uid, name, data):
+        """Faylni sessiyaning name ro'yxatiga qo'shadi va ro'yxat uzunligini qaytaradi.
+        data - bytes yoki fayl obyekti (boshidan oxirigacha bo'laklab ko'chiriladi)"""
+        uid = str(uid)
+        is_bytes = isinstance(data, (bytes, bytearray, memoryview))
+        size = len(data) if is_bytes else data.seek(0, 2)
+        with self.lock:
+            s = self.state(uid)
+            used = sum(n for items in s.get(self.BLOBS, {}).values() for _, n in items)
+            if used + size > self.user_quota:
+                raise SessionQuotaError(f"{used + size} > {self.user_quota} bayt")
+            folder = os.path.join(self.blob_dir, uid)
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{name}_{uuid.uuid4().hex}.bin")
+            items = s.setdefault(self.BLOBS, {}).setdefault(name, [])
+            items.append([os.path.basename(path), size])
+            self.dirty.add(uid)
+        with open(path, "wb") as f:
+            if is_bytes: f.write(data)
+            else: data.seek(0); shutil.copyfileobj(data, f)
+        return len(items)
+
+    def set_blob(self, uid, name, data):
+        """name ostida faqat bitta fayl saqlaydi (oldingisi o'chiriladi)"""
+        self.clear_blobs(uid, name)
+        return self.add_blob(uid, name, data)
+
+    def blob_paths(self, uid, name):
+        """name ro'yxatidagi, diskda hali bor fayllar yo'llari (qo'shilish tartibida); mazmun o'qilmaydi"""
+        uid = str(uid)
+        with self.lock:
+            items = list(self.state(uid).get(self.BLOBS, {}).get(name, []))
+        paths = (os.path.join(self.blob_dir, uid, fname) for fname, _ in items)
+        return [p for p in paths if os.path.exists(p)]
+
+    def blobs(self, uid, name):
+        """name ro'yxatidagi fayllar mazmuni (qo'shilish tartibida)"""
+        out = []
+        for path in self.blob_paths(uid, name):
+            try:
+                with open(path, "rb") as f: out.append(f.read())
+            except OSError: pass # TTL bo'yicha o'chirilgan
+        return out
+
+    def blob_path(self, uid, name):
+        """name ro'yxatidagi oxirgi fayl yo'li (yo'q bo'lsa None) - konvertorlar faylni o'zi ochadi"""
+        paths = self.blob_paths(uid, name)
+        return paths[-1] if paths else None
+
+    def clear_blobs(self, uid, name):
+        uid = str(uid)
+        with self.lock:
+            s = self.state(uid)
+            for fname, _ in s.get(self.BLOBS, {}).pop(name, []):
+                try: os.remove(os.path.join(self.blob_dir, uid, fname))
+                except OSError: pass
+            self.dirty.add(uid)
+
+    def _drop_blobs(self, uid, s):
+        s.pop(self.BLOBS, None)
+        shutil.rmtree(os.path.join(self.blob_dir, uid), ignore_errors=True)
+
+    # --- Xizmat: saqlash va tozalash ---
+    def _maintain(self):
+        now = time.time()
+        # Xotiradagi sessiyalar soni chegarasi: eng eskisi diskka yoziladi va xotiradan chiqariladi
+        while len(self.live) > self.max_live:
+            uid = next(iter(self.live))
+            self._write([uid])
+            del self.live[uid]; self.touched.pop(uid, None); self.dirty.discard(uid)
+        if now - self.last_flush >= self.flush_sec:
+            self.flush()
+        if now - self.last_sweep >= min(60, self.ttl):
+            self.sweep(now)
+
+    def _write(self, uids):
+        rows = [(uid, json.dumps(self.live[uid], ensure_ascii=False), self.touched.get(uid, time.time())) for uid in uids if uid in self.live]
+        self.db.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", rows)
+        self.db.commit()
+
+    def flush(self):
+        """O'zgargan holatlarni bitta tranzaksiyada SQLite'ga yozadi"""
+        with self.lock:
+            self.last_flush = time.time()
+            if self.dirty:
+                self._write(self.dirty)
+                self.dirty.clear()
+
+    def sweep(self, now=None):
+        """TTL dan o'tgan sessiyalarni fayllari bilan birga o'chiradi"""
+        now = now or time.time()
+        cutoff = now - self.ttl
+        with self.lock:
+            self.last_sweep = now
+            for uid in [u for u, t in self.touched.items() if t < cutoff]:
+                self._drop_blobs(uid, self.live.pop(uid, {}))
+                self.touched.pop(uid); self.dirty.discard(uid)
+            expired = [r[0] for r in self.db.execute("SELECT uid FROM sessions WHERE updated < ?", (cutoff,))]
+            self.db.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,))
+            self.db.commit()
+            for uid in expired:
+                if uid not in self.live: shutil.rmtree(os.path.join(self.blob_dir, uid), ignore_errors=True)
+            # Bazada yozuvi qolmagan eski papkalar (masalan, yozilmay qolgan sessiyalardan)
+            for e in os.scandir(self.blob_dir):
+                if e.is_dir() and e.name not in self.live and e.stat().st_mtime < cutoff \
+                        and not self.db.execute("SELECT 1 FROM sessions WHERE uid=?", (e.name,)).fetchone():
+                    shutil.rmtree(e.path, ignore_errors=True)
+
+    def stats(self):
+        with self.lock:
+            stored = self.db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            blob_bytes = sum(size for s in self.live.values() for items in s.get(self.BLOBS, {}).values() for _, size in items)
+            return {"xotirada": len(self.live), "bazada": stored, "fayllar_mb": round(blob_bytes / 1024 / 1024, 1)}
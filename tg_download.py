@@ -0,0 +1,86 @@
+"""Telegram fayllarini bo'laklab yuklash: butun fayl bitta bytes obyekti bo'lib xotirada turmaydi.
+
+Bo'laklar Spool'ga yoziladi: chegaradan kichik fayl xotirada qoladi, kattasi diskka o'tadi.
+Hajm chegarasi Telegram aytgan file_size bo'yicha yuklashdan oldin, keyin esa yuklash davomida ham tekshiriladi.
+"""
+import io
+import mmap
+import tempfile
+
+
+class FileTooLarge(Exception):
+    """Fayl ruxsat etilgan hajmdan katta"""
+
+    def __init__(self, size, limit):
+        super().__init__(f"{size} > {limit} bayt")
+        self.size, self.limit = size, limit
+
+
+def check_size(file_size, max_bytes):
+    if file_size and file_size > max_bytes:
+        raise FileTooLarge(file_size, max_bytes)
+
+
+class Spool:
+    """Xotiradagi BytesIO bilan boshlanib, max_size dan oshganda vaqtinchalik faylga o'tadigan bufer.
+    Qaerda turgani on_disk bayrog'ida; qolgan fayl amallari (read, seek, fileno...) joriy faylga uzatiladi"""
+
+    def __init__(self, max_size):
+        self.max_size, self.file, self.on_disk = max_size, io.BytesIO(), False
+
+    def write(self, data):
+        n = self.file.write(data)
+        if not self.on_disk and self.file.tell() > self.max_size: self.rollover()
+        return n
+
+    def rollover(self):
+        if self.on_disk: return
+        mem, f = self.file, tempfile.TemporaryFile()
+        f.write(mem.getbuffer()); f.seek(mem.tell())
+        self.file, self.on_disk = f, True
+        mem.close()
+
+    def view(self):
+        """Mazmun nusxasiz: xotirada bo'lsa memoryview, diskda bo'lsa faqat o'qish uchun mmap.
+        Ikkalasi ham `with` bilan ishlatiladi: spool yopilishidan oldin view bo'shatilishi kerak"""
+        if not self.on_disk: return self.file.getbuffer()
+        return mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+
+async def download(bot, file_id, max_bytes, spool_bytes=8 * 1024 * 1024, file_size=None, digest=None, chunk_size=65536):
+    """Faylni yuklab, boshiga qaytarilgan Spool qaytaradi (yopish chaqiruvchining vazifasi).
+    digest - hashlib obyekti bo'lsa, xesh bo'laklar kelishi bilan hisoblanadi"""
+    check_size(file_size, max_bytes)
+    f = await bot.get_file(file_id)
+    check_size(f.file_size, max_bytes)
+    spool = Spool(spool_bytes)
+    try:
+        if bot.session.api.is_local:
+            await bot.download_file(f.file_path, destination=spool, chunk_size=chunk_size, seek=False)
+            check_size(spool.tell(), max_bytes)
+            spool.seek(0)
+            if digest:
+                for chunk in iter(lambda: spool.read(chunk_size), b""): digest.update(chunk)
+        else:
+            url = bot.session.api.file_url(bot.token, f.file_path)
+            size = 0
+            async for chunk in bot.session.stream_content(url=url, timeout=60, chunk_size=chunk_size, raise_for_status=True):
+                size += len(chunk)
+                check_size(size, max_bytes)
+                if digest: digest.update(chunk)
+                spool.write(chunk)
+        spool.seek(0)
+        return spool
+    except BaseException:
+        spool.close()
+        raise
+
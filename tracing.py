@@ -0,0 +1,124 @@
+"""Bosqichlar bo'yicha kechikishlar (p50/p95/p99), navbatlar chuqurligi va hovuzlar bandligi.
+
+O'chirilgan holatda stage() tayyor bo'sh kontekstni qaytaradi va track() kelajak (future) obyektiga
+tegmaydi, shuning uchun ishlov berish yo'liga deyarli xarajat qo'shilmaydi.
+"""
+import json
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+_NULL = nullcontext()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "t")
+
+    def __init__(self, tracer, name):
+        self.tracer, self.name = tracer, name
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.name, time.perf_counter() - self.t, exc_type is not None)
+
+
+class PoolMeter:
+    """Hovuz bandligi ota jarayonda, vazifa yuborilgan va tugagan paytlar bo'yicha hisoblanadi
+    (shuning uchun jarayonlar hovuzi uchun ham ishlaydi): band = ishlagan ishchi-soniyalar / (ishchilar * vaqt)"""
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.busy = 0.0
+        self.start = self.last = time.monotonic()
+
+    def _tick(self, now):
+        self.busy += min(self.inflight, self.workers) * (now - self.last)
+        self.last = now
+
+    def enter(self):
+        with self.lock:
+            self._tick(time.monotonic()); self.inflight += 1
+
+    def leave(self):
+        with self.lock:
+            self._tick(time.monotonic()); self.inflight -= 1
+
+    def stats(self):
+        with self.lock:
+            now = time.monotonic()
+            self._tick(now)
+            return {"ishlamoqda": min(self.inflight, self.workers), "navbatda": max(0, self.inflight - self.workers),
+                    "ishchilar": self.workers, "band": round(self.busy / (self.workers * max(now - self.start, 1e-6)), 3)}
+
+
+class Tracer:
+    def __init__(self, enabled=True, window=1000):
+        self.enabled, self.window = enabled, window
+        self.lock = threading.Lock()
+        self.samples = {} # bosqich -> oxirgi window ta davomiylik (soniya)
+        self.totals = {}  # bosqich -> [soni, xatolar, jami soniya]
+        self.pools = {}   # nom -> PoolMeter
+        self.gauges = {}  # nom -> navbat chuqurligini qaytaradigan funksiya
+        self.started = time.time()
+
+    def stage(self, name):
+        """with tracer.stage("nom"): ... - blok davomiyligi yoziladi (await'lar bilan ham ishlaydi)"""
+        return _Span(self, name) if self.enabled else _NULL
+
+    def record(self, name, sec, error=False):
+        if not self.enabled: return
+        with self.lock:
+            d = self.samples.get(name)
+            if d is None:
+                d = self.samples[name] = deque(maxlen=self.window)
+                self.totals[name] = [0, 0, 0.0]
+            d.append(sec)
+            t = self.totals[name]
+            t[0] += 1; t[1] += error; t[2] += sec
+
+    def pool(self, name, workers):
+        """Hovuzni ro'yxatga oladi (qayta chaqirilsa, mavjudi qaytadi)"""
+        with self.lock:
+            return self.pools.setdefault(name, PoolMeter(workers))
+
+    def track(self, name, fut):
+        """Hovuzga yuborilgan vazifa (concurrent yoki asyncio future): bandlik va yuborishdan tugashgacha vaqt"""
+        if not self.enabled: return fut
+        meter, t = self.pools.get(name) or self.pool(name, 1), time.perf_counter()
+        meter.enter()
+        def done(f):
+            meter.leave()
+            self.record(name, time.perf_counter() - t, f.cancelled() or f.exception() is not None)
+        fut.add_done_callback(done)
+        return fut
+
+    def gauge(self, name, fn):
+        """Navbat o'lchagichi; birinchi ro'yxatga olingani qoladi (bot ishlayotgan skript nusxasining o'zgaruvchilari)"""
+        self.gauges.setdefault(name, fn)
+
+    def stages(self):
+        with self.lock:
+            items = [(name, sorted(d), self.totals[name]) for name, d in self.samples.items()]
+        rows = []
+        for name, lat, (n, errors, total) in sorted(items):
+            pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))] * 1000, 1)
+            rows.append({"bosqich": name, "soni": n, "xato": errors, "o'rtacha_ms": round(total / n * 1000, 1),
+                         "p50_ms": pct(0.5), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": round(lat[-1] * 1000, 1)})
+        return rows
+
+    def snapshot(self):
+        gauges = {}
+        for name, fn in list(self.gauges.items()):
+            try: gauges[name] = fn()
+            except Exception as e: gauges[name] = f"xato: {e}"
+        return {"vaqt": time.time(), "yoqilgan": self.enabled, "ishlash_vaqti_s": round(time.time() - self.started),
+                "bosqichlar": self.stages(), "hovuzlar": {n: m.stats() for n, m in list(self.pools.items())}, "navbatlar": gauges}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
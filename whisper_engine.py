@@ -0,0 +1,158 @@
+"""Lokal Whisper dvigateli: jimlik bo'yicha bo'lish va jarayonlar hovuzida parallel tahlil.
+
+Hovuzdagi funksiyalar alohida modulda turadi, chunki Streamlit skriptni har safar
+qayta bajaradi va u yerda e'lon qilingan funksiyalarni boshqa jarayonga uzatib bo'lmaydi.
+Hovuz "fork" bilan ochiladi: "spawn" bola jarayonda Streamlit skriptining o'zini qayta ishga tushirgan bo'lardi.
+"""
+import multiprocessing as mp
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# torch va whisper faqat ishchi jarayonlarda (model yuklanganda) import qilinadi: Streamlit skripti ularni kutmaydi
+SAMPLE_RATE = 16000 # whisper.audio.SAMPLE_RATE
+FRAME = SAMPLE_RATE // 50 # 20 ms li kadrlar
+
+OPUS_BITRATE = "24k" # Nutq uchun yetarli, WAV dan ~20 barobar kichik
+
+# Har bir ishchi jarayonning o'z modellari va ularni yuklash/qizdirish ko'rsatkichlari
+_models = {}
+_info = {}
+_quantize = False
+_int8_layers = {} # model -> int8 ga o'tkazilgan Linear qatlamlar soni
+
+def decode_audio(data):
+    """Telegramdan kelgan baytlarni diskka yozmasdan 16 kHz mono float32 massivga aylantiradi.
+    m4a kabi oxirida indeksi bor formatlar uchun ffmpeg'ga qidiriladigan (seekable) xotiradagi fayl beriladi.
+    data diskdagi fayl obyekti bo'lsa, ffmpeg uni nusxasiz o'zi o'qiydi"""
+    cmd = ["ffmpeg", "-nostdin", "-v", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+    if hasattr(data, "fileno"):
+        fd = data.fileno()
+        cmd[cmd.index("pipe:0")] = f"/proc/self/fd/{fd}"
+        out = subprocess.run(cmd, capture_output=True, check=True, pass_fds=(fd,)).stdout
+    elif hasattr(os, "memfd_create"):
+        fd = os.memfd_create("audio")
+        try:
+            with open(fd, "wb", closefd=False) as f: f.write(data)
+            cmd[cmd.index("pipe:0")] = f"/proc/self/fd/{fd}"
+            out = subprocess.run(cmd, capture_output=True, check=True, pass_fds=(fd,)).stdout
+        finally:
+            os.close(fd)
+    else:
+        out = subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+def encode_opus(samples):
+    """16 kHz mono massivni xotirada ixcham Ogg/Opus formatiga o'giradi (Groq'ga yuklash uchun)"""
+    pcm = (np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes()
+    cmd = ["ffmpeg", "-nostdin", "-v", "error", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "pipe:0",
+           "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip", "-f", "ogg", "pipe:1"]
+    return subprocess.run(cmd, input=pcm, capture_output=True, check=True).stdout
+
+def split_on_silence(audio, max_sec, search_sec=None):
+    """Audioni max_sec dan oshmaydigan bo'laklarga bo'ladi. Kesish nuqtasi har bir bo'lak
+    oxiridagi search_sec oralig'idagi eng jim joydan tanlanadi. (boshi, oxiri) indekslarini qaytaradi"""
+    n = len(audio) // FRAME
+    max_f = max(1, int(max_sec * 50))
+    search_f = max(1, int((search_sec or max_sec / 3) * 50))
+    if n <= max_f:
+        return [(0, len(audio))] if len(audio) else []
+
+    energy = np.sqrt(np.mean(np.square(audio[:n * FRAME].reshape(n, FRAME)), axis=1))
+    # ~200 ms bo'yi silliqlash: bitta jim kadr emas, davomli pauza qidiriladi
+    energy = np.convolve(energy, np.ones(10) / 10, mode="same")
+
+    cuts, pos = [], 0
+    while n - pos > max_f:
+        lo = pos + max_f - search_f
+        cut = lo + int(np.argmin(energy[lo:pos + max_f]))
+        cuts.append(cut)
+        pos = cut
+    edges = [0] + [c * FRAME for c in cuts] + [len(audio)]
+    return list(zip(edges[:-1], edges[1:]))
+
+def load_model(name, quantize=False):
+    """CPU uchun modelni yuklaydi; quantize=True bo'lsa Linear qatlamlar int8 ga o'tkaziladi"""
+    import torch
+    import whisper
+    model = whisper.load_model(name, device="cpu")
+    if quantize:
+        # whisper o'z Linear'idan (nn.Linear vorisi, faqat vazn dtype'ini moslaydi) foydalanadi; quantize_dynamic
+        # turlarni aniq solishtiradi, shuning uchun ular oddiy nn.Linear ga o'tkaziladi (CPU float32 da natija bir xil)
+        for m in model.modules():
+            if isinstance(m, torch.nn.Linear): m.__class__ = torch.nn.Linear
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        swapped = sum(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in model.modules())
+        if not swapped:
+            raise RuntimeError(f"{name}: int8 kvantlashda birorta ham Linear qatlam almashtirilmadi")
+        _int8_layers[name] = swapped
+    return model
+
+def warm_up(model, seconds=2):
+    """Qisqa sun'iy klip bilan birinchi chaqiruvdagi JIT va xotira ajratish xarajatini oldindan to'lash.
+    Real vaqt koeffitsiyentini (RTF) qaytaradi"""
+    clip = np.random.default_rng(0).normal(0, 1e-3, SAMPLE_RATE * seconds).astype(np.float32)
+    t = time.perf_counter()
+    model.transcribe(clip, fp16=False)
+    return (time.perf_counter() - t) / seconds
+
+def _get_model(name):
+    if name not in _models:
+        t = time.perf_counter()
+        _models[name] = load_model(name, _quantize)
+        _info[name] = {"load_sec": round(time.perf_counter() - t, 2), "warmup_rtf": round(warm_up(_models[name]), 3),
+                       "int8_layers": _int8_layers.get(name, 0)}
+    return _models[name]
+
+def _init_worker(names, quantize, threads):
+    global _quantize
+    import torch
+    _quantize = quantize
+    torch.set_num_threads(threads)
+    for name in names: _get_model(name)
+
+def worker_info():
+    """Ishchi jarayondagi modellar: yuklash vaqti va qizdirishdagi RTF"""
+    return dict(_info)
+
+def transcribe_piece(samples, offset, language=None, model_name="base"):
+    """Bitta bo'lakni tahlil qiladi; vaqtlar butun audio boshiga nisbatan qaytariladi.
+    (segmentlar, til, sarflangan soniyalar) qaytaradi"""
+    t = time.perf_counter()
+    res = _get_model(model_name).transcribe(samples, language=language, fp16=False)
+    segs = [{'start': offset + float(s['start']), 'end': offset + float(s['end']), 'text': s['text']} for s in res['segments']]
+    return segs, res.get('language'), time.perf_counter() - t
+
+def create_pool(workers, preload=("base",), quantize=False, threads=1):
+    """Har bir jarayon preload dagi modellarni bir marta yuklab, qizdirib oladigan hovuz"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("fork"),
+                               initializer=_init_worker, initargs=(tuple(preload), quantize, threads))
+
+class EngineStats:
+    """Modellar bo'yicha real vaqt koeffitsiyenti: RTF = tahlil vaqti / audio davomiyligi (1 dan kichigi - real vaqtdan tez)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {} # model -> [audio soniyalar, tahlil soniyalari, bo'laklar soni]
+        self.warmup = {}
+
+    def record(self, model, audio_sec, elapsed):
+        with self.lock:
+            t = self.totals.setdefault(model, [0.0, 0.0, 0])
+            t[0] += audio_sec; t[1] += elapsed; t[2] += 1
+
+    def set_warmup(self, info):
+        with self.lock:
+            self.warmup.update(info)
+
+    def report(self):
+        with self.lock:
+            rows = {m: {"audio_sec": round(a, 1), "rtf": round(e / a, 3) if a else None, "chunks": n}
+                    for m, (a, e, n) in self.totals.items()}
+            for m, info in self.warmup.items():
+                rows.setdefault(m, {}).update(info)
+        return rows